@@ -0,0 +1,90 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import integrations
+from .models import Announcement
+from .queues import claim_batch, finish_batch
+
+# New stores and products are announced through a queue: saving one adds an
+# Announcement row in the same transaction, and the dispatch_announcements
+# worker posts due rows in batches with the transport named by
+# ANNOUNCEMENT_TRANSPORT (built once per process, see integrations.py), so
+# requests never wait on the social network's API.
+DEFAULT_BATCH_SIZE = 50
+
+
+class RateLimited(Exception):
+    """Raised by a transport when the API refuses posts for `retry_after` seconds."""
+
+    def __init__(self, retry_after=None):
+        self.retry_after = retry_after
+        super().__init__(f"Rate limited, retry after {retry_after or 'a while'}s")
+
+
+class MemoryTransport:
+    """In-process transport for tests and local runs; posts are kept in `sent`."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, text):
+        self.sent.append(text)
+
+
+def _queue(kind, object_id, text):
+    Announcement.objects.bulk_create(
+        [Announcement(kind=kind, object_id=object_id, text=text[:280])],
+        ignore_conflicts=True,
+    )
+
+
+def announce_store(store):
+    """Queue the post for a new store, unless it was queued before."""
+    _queue("store", store.pk, f"A new store has been added: {store.name}! Check it out now.")
+
+
+def announce_product(product):
+    """Queue the post for a new product, unless it was queued before."""
+    _queue(
+        "product", product.pk,
+        f"{product.store.name} just added a new product: {product.name}! Take a look.",
+    )
+
+
+def dispatch_batch(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Post one batch of due announcements. Returns (sent, failed); failed posts
+    are retried later with backoff. When the transport reports a rate limit,
+    the rest of the batch waits until the limit resets without using up an
+    attempt.
+    """
+    batch = claim_batch(Announcement, "ANNOUNCEMENT", batch_size)
+    if not batch:
+        return 0, 0
+
+    transport = integrations.get("announcements")
+    sent, failed, deferred = [], [], []
+    retry_at = None
+    for item in batch:
+        if retry_at is not None:
+            deferred.append(item)
+            continue
+        try:
+            transport.send(item.text)
+        except RateLimited as e:
+            wait = e.retry_after or getattr(settings, "ANNOUNCEMENT_RETRY_DELAY", 60)
+            retry_at = timezone.now() + timedelta(seconds=wait)
+            deferred.append(item)
+        except Exception as e:
+            item.last_error = str(e)
+            failed.append(item)
+        else:
+            sent.append(item)
+
+    if deferred:
+        Announcement.objects.filter(pk__in=[item.pk for item in deferred]).update(
+            next_attempt_at=retry_at
+        )
+    return finish_batch(Announcement, "ANNOUNCEMENT", sent, failed)
@@ -2,11 +2,12 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework.authtoken import views as drf_authtoken_views
 
-from .api_views import StoreViewSet, ProductViewSet, VendorStoresView
+from .api_views import StoreViewSet, ProductViewSet, OrderViewSet, VendorStoresView
 
 router = DefaultRouter()
 router.register(r"stores", StoreViewSet, basename="store")
 router.register(r"products", ProductViewSet, basename="product")
+router.register(r"orders", OrderViewSet, basename="order")
 
 urlpatterns = [
     path("", include(router.urls)),
@@ -1,23 +1,77 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 
-from .models import Store, Product, Review, OrderItem
-from .serializers import StoreSerializer, ProductSerializer, ReviewSerializer
+from .models import Store, Product, Review, Order, Purchase
+from .serializers import (
+    StoreSerializer, ProductSerializer, ReviewSerializer, OrderSerializer, expand_queryset,
+)
 from .api_permissions import IsVendor, IsOwnerOrReadOnly
+from .conditional import conditional_get
+from .facets import apply_filters, facet_counts
+from .forms import ProductFilterForm
+from .idempotency import idempotent
+from .pagination import (
+    CatalogCursorPagination, OrderCursorPagination, ReviewCursorPagination, keyset_paginate,
+)
+from .search import RANK_ORDERING, search_products
 
 
-class StoreViewSet(viewsets.ModelViewSet):
+class PlannedQuerysetMixin:
+    """
+    Prepare the viewset's queryset with the select/prefetch plan of the serializer
+    that renders it (see serializers.expansion_plan). `planned_actions` lists the
+    actions that serialize this queryset; custom actions that serialize another
+    queryset plan it themselves with expand_queryset.
+    """
+
+    planned_actions = ("list", "retrieve")
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.planned_actions:
+            queryset = expand_queryset(queryset, self.get_serializer_class(), self.request)
+        return queryset
+
+
+class ConditionalReadMixin:
+    """
+    Serve list and retrieve with ETag/Last-Modified validators computed from
+    the rows' updated_at (see conditional.py), answering 304 when unchanged.
+    """
+
+    def list(self, request, *args, **kwargs):
+        build = super().list
+        return conditional_get(
+            request, self.filter_queryset(self.get_queryset()),
+            lambda: build(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        build = super().retrieve
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        return conditional_get(
+            request, self.get_queryset().filter(**lookup),
+            lambda: build(request, *args, **kwargs),
+        )
+
+
+class StoreViewSet(ConditionalReadMixin, PlannedQuerysetMixin, viewsets.ModelViewSet):
     """
     /api/stores/  - list, create (vendor)
     /api/stores/{id}/ - retrieve, update, delete (owner only for write)
+
+    Stores are flat by default; ?expand=owner,products nests related objects.
     """
 
-    queryset = Store.objects.all().select_related("owner")
+    queryset = Store.objects.all()
     serializer_class = StoreSerializer
     permission_classes = [IsOwnerOrReadOnly]
+    pagination_class = CatalogCursorPagination
 
     def get_permissions(self):
         # Allow creation only for vendors
@@ -30,25 +84,30 @@ class StoreViewSet(viewsets.ModelViewSet):
         user = self.request.user
         if hasattr(user, "store"):
             # vendor already has a store
-            from rest_framework.exceptions import ValidationError
             raise ValidationError("Vendor already has a store.")
         serializer.save(owner=user)
 
     @action(detail=True, methods=["get"], permission_classes=[AllowAny])
     def products(self, request, pk=None):
         """List products that belong to this store."""
-        store = self.get_object()
-        products = store.products.all()
-        serializer = ProductSerializer(products, many=True, context={"request": request})
-        return Response(serializer.data)
+
+        def build_response():
+            store = self.get_object()
+            products = expand_queryset(store.products.all(), ProductSerializer, request)
+            page = self.paginate_queryset(products)
+            serializer = ProductSerializer(page, many=True, context={"request": request})
+            return self.get_paginated_response(serializer.data)
+
+        return conditional_get(request, Product.objects.filter(store_id=pk), build_response)
 
     @products.mapping.post
+    @idempotent
     def add_product(self, request, pk=None):
         """
         Create a product under this store. Only store owner (vendor) allowed.
         """
         store = self.get_object()
-        if getattr(store.owner, "id", None) != request.user.id:
+        if store.owner_id != request.user.id:
             return Response(
                 {"detail": "Only the store owner can add products."},
                 status=status.HTTP_403_FORBIDDEN,
@@ -60,22 +119,85 @@ class StoreViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
+class ProductViewSet(ConditionalReadMixin, PlannedQuerysetMixin, viewsets.ReadOnlyModelViewSet):
     """
     /api/products/         - list, retrieve
     /api/products/{id}/reviews/ - GET reviews, POST review (auth required)
+
+    list and search accept the facets min_price, max_price, in_stock, store and
+    min_rating; their first page also carries per-facet counts under "facets".
+    Products are flat by default; ?expand=store,reviews nests related objects.
     """
 
-    queryset = Product.objects.all().select_related("store")
+    queryset = Product.objects.all()
     serializer_class = ProductSerializer
-
-    @action(detail=True, methods=["get"], permission_classes=[AllowAny])
+    pagination_class = CatalogCursorPagination
+    planned_actions = ("list", "retrieve", "search")
+
+    def get_filters(self):
+        """Validated facet selection from the query string."""
+        form = ProductFilterForm(self.request.query_params)
+        if not form.is_valid():
+            raise ValidationError(form.errors)
+        return form.cleaned_data
+
+    def list(self, request, *args, **kwargs):
+        # Validators cover every product, not just the filtered ones, since the
+        # facet counts in the response depend on products outside the filter.
+        return conditional_get(request, Product.objects.all(), self.build_list_response)
+
+    def build_list_response(self):
+        filters = self.get_filters()
+        queryset = self.get_queryset()
+        page = self.paginate_queryset(apply_filters(queryset, filters))
+        serializer = self.get_serializer(page, many=True)
+        response = self.get_paginated_response(serializer.data)
+        if not self.request.query_params.get("cursor"):
+            response.data["facets"] = facet_counts(queryset, filters)
+        return response
+
+    @action(detail=False, methods=["get"], permission_classes=[AllowAny])
+    def search(self, request):
+        """
+        /api/products/search/?q=<terms> - products ranked by relevance, most
+        relevant first, paginated with an opaque `cursor`.
+        """
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response(
+                {"detail": "A search query is required (?q=)."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        filters = self.get_filters()
+        matches = search_products(query, self.get_queryset())
+        page = keyset_paginate(request, apply_filters(matches, filters), ordering=RANK_ORDERING)
+        serializer = ProductSerializer(page.object_list, many=True, context={"request": request})
+        next_url = None
+        if page.has_next:
+            next_url = request.build_absolute_uri(f"{request.path}?{page.next_query}")
+        data = {"next": next_url, "results": serializer.data}
+        if not request.query_params.get("cursor"):
+            data["facets"] = facet_counts(matches, filters)
+        return Response(data)
+
+    @action(
+        detail=True, methods=["get"], permission_classes=[AllowAny],
+        pagination_class=ReviewCursorPagination,
+    )
     def reviews(self, request, pk=None):
-        product = self.get_object()
-        serializer = ReviewSerializer(product.reviews.all(), many=True)
-        return Response(serializer.data)
+        """Reviews of this product, newest first; follow `next` to load more."""
+
+        def build_response():
+            product = self.get_object()
+            reviews = expand_queryset(product.reviews.all(), ReviewSerializer, request)
+            page = self.paginate_queryset(reviews)
+            serializer = ReviewSerializer(page, many=True, context={"request": request})
+            return self.get_paginated_response(serializer.data)
+
+        return conditional_get(request, Review.objects.filter(product_id=pk), build_response)
 
     @reviews.mapping.post
+    @idempotent
     def add_review(self, request, pk=None):
         """Authenticated users can post reviews; server sets verified flag."""
         if not request.user.is_authenticated:
@@ -85,22 +207,28 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         if serializer.is_valid():
             # mark verified if user purchased product
             user = request.user
-            # try both possible order link names: 'order__user' or 'order__buyer'
-            bought = OrderItem.objects.filter(
-                product=product,
-            ).filter(
-                order__user=user
-            ).exists() or OrderItem.objects.filter(
-                product=product,
-            ).filter(
-                order__buyer=user
-            ).exists()
-            review = serializer.save(user=user, verified=bought, product=product)
-            out = ReviewSerializer(review)
+            bought = Purchase.has_bought(user, product)
+            with transaction.atomic():
+                review = serializer.save(user=user, verified=bought, product=product)
+            out = ReviewSerializer(review, context={"request": request})
             return Response(out.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class OrderViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    /api/orders/ - the authenticated user's orders, newest first. Lines carry
+    the snapshot taken at checkout, so this reads orders and their items only.
+    """
+
+    serializer_class = OrderSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
+
+    def get_queryset(self):
+        return Order.objects.filter(user=self.request.user).prefetch_related("items")
+
+
 # small helper view to list stores for a vendor id
 from rest_framework.views import APIView
 
@@ -111,6 +239,8 @@ class VendorStoresView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request, vendor_id):
-        stores = Store.objects.filter(owner__id=vendor_id)
-        serializer = StoreSerializer(stores, many=True)
+        stores = expand_queryset(
+            Store.objects.filter(owner__id=vendor_id), StoreSerializer, request
+        )
+        serializer = StoreSerializer(stores, many=True, context={"request": request})
         return Response(serializer.data)
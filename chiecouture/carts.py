@@ -0,0 +1,90 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Cart, CartItem, Product
+from .pricing import CartPricing, bump_cart_version, price_cart
+
+# Cart additions are collected in the session as {product id: quantity} and only
+# written to the user's Cart/CartItem rows when the cart is looked at, at
+# checkout, on logout, or at most every CART_PERSIST_INTERVAL seconds while
+# browsing. Anonymous visitors keep theirs in the session until they log in.
+SESSION_KEY = "cart"
+FLUSHED_AT_KEY = "cart_flushed_at"
+
+
+def pending_items(request):
+    """Quantities added in this session that are not in the database yet, by product id."""
+    return {int(pk): quantity for pk, quantity in request.session.get(SESSION_KEY, {}).items()}
+
+
+def add_to_session_cart(request, product_id, quantity):
+    pending = request.session.get(SESSION_KEY, {})
+    key = str(product_id)
+    pending[key] = pending.get(key, 0) + quantity
+    request.session[SESSION_KEY] = pending
+
+    interval = getattr(settings, "CART_PERSIST_INTERVAL", 300)
+    if time.time() - request.session.get(FLUSHED_AT_KEY, 0) >= interval:
+        flush_cart(request)
+
+
+def flush_cart(request, user=None):
+    """Write the session's pending additions into the cart of `user` (default: request.user)."""
+    user = user or request.user
+    if not user.is_authenticated:
+        return
+    pending = pending_items(request)
+    request.session.pop(SESSION_KEY, None)
+    request.session[FLUSHED_AT_KEY] = time.time()
+    if pending:
+        merge_into_cart(user, pending)
+
+
+def merge_into_cart(user, quantities):
+    """
+    Add `quantities` ({product id: quantity}) to the user's cart with a fixed
+    number of queries. Products deleted since they were added are skipped.
+    """
+    quantities = dict(quantities)
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(user=user)
+        existing = list(
+            CartItem.objects.select_for_update().filter(cart=cart, product_id__in=quantities)
+        )
+        for item in existing:
+            item.quantity += quantities.pop(item.product_id, 0)
+        CartItem.objects.bulk_update(existing, ["quantity"])
+        if quantities:
+            available = Product.objects.filter(pk__in=quantities).values_list("pk", flat=True)
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, product_id=pk, quantity=quantities[pk]) for pk in available
+            ])
+    bump_cart_version(cart.pk)
+
+
+def update_quantities(user, quantities):
+    """
+    Apply `quantities` ({cart item id: quantity}) to the user's cart: items set
+    to zero or less are removed, ids from other carts are ignored. Uses one
+    select, one bulk update and one delete, and returns the new cart pricing.
+    """
+    with transaction.atomic():
+        items = list(CartItem.objects.select_for_update().filter(cart__user=user))
+        changed, removed = [], []
+        for item in items:
+            quantity = quantities.get(item.pk, item.quantity)
+            if quantity <= 0:
+                removed.append(item.pk)
+            elif quantity != item.quantity:
+                item.quantity = quantity
+                changed.append(item)
+        if changed:
+            CartItem.objects.bulk_update(changed, ["quantity"])
+        if removed:
+            CartItem.objects.filter(pk__in=removed).delete()
+    if not items:
+        return CartPricing([])
+    bump_cart_version(items[0].cart_id)
+    return price_cart(items[0].cart_id)
@@ -0,0 +1,53 @@
+from django.db import transaction
+
+from .models import CartItem, Order, OrderItem, Purchase
+from .outbox import queue_email
+from .pricing import bump_cart_version, price_cart
+from .reservations import take_stock
+
+
+class CheckoutError(Exception):
+    """Checkout could not be completed; nothing was written."""
+
+
+def invoice_text(order, pricing):
+    lines = [f"Invoice for Order #{order.id}\n\n"]
+    for line in pricing:
+        lines.append(f"- {line.name} (x{line.quantity}) = ${line.line_total:.2f}")
+    lines.append(f"\nTotal: ${pricing.subtotal:.2f}")
+    return "\n".join(lines)
+
+
+def place_order(user, cart):
+    """
+    Turn the contents of `cart` into an Order in a single transaction: price
+    the cart, claim its items, take the stock (using up the user's holds),
+    create the order, bulk-create its items, record the purchases and queue
+    the invoice email. The number of queries does not depend on the number of
+    items. Rolls back and raises CheckoutError if the cart is empty or changed
+    in the meantime, or InsufficientStock if a product ran out.
+    """
+    with transaction.atomic():
+        pricing = price_cart(cart.pk, cached=False)
+        if not pricing:
+            raise CheckoutError("Your cart is empty.")
+
+        # Deleting the cart items first also stops a second, concurrent checkout
+        # of the same cart from ordering them again.
+        deleted, _ = CartItem.objects.filter(pk__in=[line.item_id for line in pricing]).delete()
+        if deleted != len(pricing):
+            raise CheckoutError("Your cart changed during checkout.")
+        take_stock(user, pricing.quantities)
+        order = Order.objects.create(user=user, total=pricing.subtotal)
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=line.product_id, product_name=line.name,
+                      store_id=line.store_id, quantity=line.quantity, price=line.price)
+            for line in pricing
+        ])
+        Purchase.record(user.pk, pricing.quantities)
+        queue_email(
+            f"Your Invoice - Order #{order.id}", invoice_text(order, pricing), [user.email]
+        )
+
+    bump_cart_version(cart.pk)
+    return order, order_items
@@ -0,0 +1,52 @@
+import hashlib
+from calendar import timegm
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def queryset_validators(queryset):
+    """
+    Return (last_modified, count) for `queryset` with one aggregate query.
+    The count makes deletions change the validators even though they leave no
+    newer updated_at behind.
+    """
+    result = queryset.order_by().aggregate(last_modified=Max("updated_at"), count=Count("pk"))
+    return result["last_modified"], result["count"]
+
+
+def make_etag(request, last_modified, count):
+    """Weak ETag for one representation: the URL, media type and user plus the validators."""
+    parts = [
+        request.get_full_path(),
+        getattr(request, "accepted_media_type", ""),
+        str(getattr(request.user, "pk", "")),
+        str(count),
+        last_modified.isoformat() if last_modified else "",
+    ]
+    digest = hashlib.md5("|".join(parts).encode(), usedforsecurity=False).hexdigest()
+    return "W/" + quote_etag(digest)
+
+
+def conditional_get(request, queryset, build_response):
+    """
+    Answer a GET for the rows in `queryset` with 304 Not Modified when the
+    client's If-None-Match / If-Modified-Since still match, and otherwise call
+    `build_response()`. Either way ETag and Last-Modified headers are set.
+
+    Validators only track the listed rows, so requests that nest related
+    objects with ?expand= are always served in full.
+    """
+    if request.method not in ("GET", "HEAD") or request.GET.get("expand"):
+        return build_response()
+    last_modified, count = queryset_validators(queryset)
+    etag = make_etag(request, last_modified, count)
+    timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = build_response()
+    response["ETag"] = etag
+    if timestamp is not None:
+        response["Last-Modified"] = http_date(timestamp)
+    return response
@@ -0,0 +1,82 @@
+from django.db.models import Count, Q
+
+PRICE_BUCKETS = ((0, 25), (25, 50), (50, 100), (100, 250), (250, None))
+RATING_THRESHOLDS = (4, 3, 2, 1)
+STORE_FACET_LIMIT = 20
+
+
+def filter_q(filters, skip=None):
+    """
+    A Q matching the cleaned data of a ProductFilterForm. `skip` names one
+    facet ("price", "in_stock", "store" or "min_rating") to leave out, which is
+    how each facet's counts ignore that facet's own selection.
+    """
+    q = Q()
+    if skip != "price":
+        if filters.get("min_price") is not None:
+            q &= Q(price__gte=filters["min_price"])
+        if filters.get("max_price") is not None:
+            q &= Q(price__lte=filters["max_price"])
+    if skip != "in_stock" and filters.get("in_stock"):
+        q &= Q(stock__gt=0)
+    if skip != "store" and filters.get("store"):
+        q &= Q(store_id=filters["store"])
+    if skip != "min_rating" and filters.get("min_rating") is not None:
+        q &= Q(rating_average__gte=filters["min_rating"])
+    return q
+
+
+def apply_filters(queryset, filters, skip=None):
+    """Narrow a Product queryset by the cleaned data of a ProductFilterForm (see filter_q)."""
+    return queryset.filter(filter_q(filters, skip))
+
+
+def _price_q(low, high):
+    q = Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def facet_counts(queryset, filters):
+    """
+    Count matching products per facet value. The price, stock and rating counts
+    come from one conditional aggregate over `queryset`, each count filtered by
+    every other selected facet; store counts are grouped in a second query.
+    """
+    price_q = filter_q(filters, skip="price")
+    stock_q = filter_q(filters, skip="in_stock")
+    rating_q = filter_q(filters, skip="min_rating")
+    counts = queryset.order_by().aggregate(
+        **{
+            f"bucket_{i}": Count("id", filter=price_q & _price_q(low, high))
+            for i, (low, high) in enumerate(PRICE_BUCKETS)
+        },
+        in_stock=Count("id", filter=stock_q & Q(stock__gt=0)),
+        out_of_stock=Count("id", filter=stock_q & Q(stock=0)),
+        **{
+            f"rating_{value}": Count("id", filter=rating_q & Q(rating_average__gte=value))
+            for value in RATING_THRESHOLDS
+        },
+    )
+    stores = (
+        apply_filters(queryset, filters, skip="store")
+        .order_by()
+        .values("store_id", "store__name")
+        .annotate(count=Count("id"))
+        .order_by("-count", "store_id")[:STORE_FACET_LIMIT]
+    )
+    return {
+        "price": [
+            {"min": low, "max": high, "count": counts[f"bucket_{i}"]}
+            for i, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+        "in_stock": {"in_stock": counts["in_stock"], "out_of_stock": counts["out_of_stock"]},
+        "min_rating": [
+            {"value": value, "count": counts[f"rating_{value}"]} for value in RATING_THRESHOLDS
+        ],
+        "store": [
+            {"id": row["store_id"], "name": row["store__name"], "count": row["count"]}
+            for row in stores
+        ],
+    }
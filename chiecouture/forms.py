@@ -65,3 +65,34 @@ class ReviewForm(forms.ModelForm):
         if rating < 1 or rating > 5:
             raise forms.ValidationError("Rating must be between 1 and 5.")
         return rating
+
+
+class ProductFilterForm(forms.Form):
+    """Catalog facets read from the query string (see facets.py)."""
+    min_price = forms.DecimalField(
+        required=False, min_value=0, decimal_places=2,
+        widget=forms.NumberInput(attrs={"class": "form-control", "step": "0.01", "min": "0"}),
+    )
+    max_price = forms.DecimalField(
+        required=False, min_value=0, decimal_places=2,
+        widget=forms.NumberInput(attrs={"class": "form-control", "step": "0.01", "min": "0"}),
+    )
+    in_stock = forms.BooleanField(
+        required=False, widget=forms.CheckboxInput(attrs={"class": "form-check-input"})
+    )
+    store = forms.IntegerField(required=False, min_value=1, widget=forms.HiddenInput)
+    min_rating = forms.DecimalField(
+        required=False, min_value=1, max_value=5, decimal_places=2,
+        widget=forms.NumberInput(
+            attrs={"class": "form-control", "step": "0.5", "min": 1, "max": 5}
+        ),
+    )
+
+    def clean(self):
+        """Ensure the price range is not inverted."""
+        cleaned_data = super().clean()
+        min_price = cleaned_data.get("min_price")
+        max_price = cleaned_data.get("max_price")
+        if min_price is not None and max_price is not None and min_price > max_price:
+            raise forms.ValidationError("Minimum price cannot exceed maximum price.")
+        return cleaned_data
@@ -0,0 +1,28 @@
+from .versions import bump_version, get_versions
+
+# Cached card fragments are keyed by object id plus a version token (see
+# versions.py). Saving or deleting the object stores a new token (see
+# signals.py), so stale fragments are never read again and simply age out of
+# the cache (templates cache cards for an hour).
+
+
+def _version_key(kind, pk):
+    return f"card-version:{kind}:{pk}"
+
+
+def bump_card_version(kind, pk):
+    """Invalidate every cached card fragment of one object ("product" or "store")."""
+    bump_version(_version_key(kind, pk))
+
+
+def attach_card_versions(objects, kind):
+    """
+    Set `card_version` on each object for use in {% cache %} vary-on arguments,
+    reading all versions with one cache round trip. Returns the objects as a list.
+    """
+    objects = list(objects)
+    keys = {obj.pk: _version_key(kind, obj.pk) for obj in objects}
+    versions = get_versions(keys.values())
+    for obj in objects:
+        obj.card_version = versions[keys[obj.pk]]
+    return objects
@@ -0,0 +1,111 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+# Headers worth replaying; cookies and per-response headers are left out.
+STORED_HEADERS = ("Content-Type", "Location")
+# Bodies fingerprinted from the parsed form rather than the raw bytes.
+FORM_CONTENT_TYPES = ("multipart/form-data", "application/x-www-form-urlencoded")
+
+
+def idempotent(view_func):
+    """
+    Mark a view (or viewset action) whose POSTs honour the Idempotency-Key
+    header; IdempotencyMiddleware does the work.
+    """
+    view_func.idempotent = True
+    return view_func
+
+
+def is_idempotent_view(request, view_func):
+    """True if `view_func` (a plain view or a viewset's as_view()) is marked @idempotent."""
+    if getattr(view_func, "idempotent", False):
+        return True
+    actions = getattr(view_func, "actions", None)
+    if actions and hasattr(view_func, "cls"):
+        handler = getattr(view_func.cls, actions.get(request.method.lower(), ""), None)
+        return getattr(handler, "idempotent", False)
+    return False
+
+
+def _digest(value):
+    return hashlib.sha256(value.encode() if isinstance(value, str) else value).hexdigest()
+
+
+def request_scope(request):
+    """
+    Keys are only shared between requests of the same client: the session user,
+    for token clients (authenticated inside the API view) the credentials, or
+    else the session. None for a client that is none of these, whose keys
+    cannot be told apart from other anonymous clients'.
+    """
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    if request.META.get("HTTP_AUTHORIZATION"):
+        return f"auth:{_digest(request.META['HTTP_AUTHORIZATION'])}"
+    session_key = getattr(getattr(request, "session", None), "session_key", None)
+    if session_key:
+        return f"session:{_digest(session_key)}"
+    return None
+
+
+def request_fingerprint(request):
+    """
+    Digest of the request's content. Forms are hashed from the parsed fields
+    and the uploaded files' names and sizes, so uploads are never read into
+    memory (request.body would refuse ones over DATA_UPLOAD_MAX_MEMORY_SIZE).
+    """
+    if request.content_type not in FORM_CONTENT_TYPES:
+        return _digest(request.body)
+    digest = hashlib.sha256()
+    for name, values in sorted(request.POST.lists()):
+        digest.update(repr((name, values)).encode())
+    for name, files in sorted(request.FILES.lists()):
+        digest.update(repr((name, [(f.name, f.size) for f in files])).encode())
+    return digest.hexdigest()
+
+
+class IdempotencyRecord:
+    """The cache entries of one idempotency key: an in-flight lock and the stored response."""
+
+    def __init__(self, request, key, scope):
+        scope = _digest(f"{scope}|{request.method}|{request.path}|{key}")
+        self.cache_key = f"idempotency:{scope}"
+        self.lock_key = f"{self.cache_key}:lock"
+        self.fingerprint = request_fingerprint(request)
+
+    @property
+    def timeout(self):
+        return getattr(settings, "IDEMPOTENCY_KEY_TTL", 24 * 60 * 60)
+
+    def acquire(self):
+        """Claim the key for this request; False if another request holds it."""
+        return cache.add(self.lock_key, True, getattr(settings, "IDEMPOTENCY_LOCK_TIMEOUT", 60))
+
+    def release(self):
+        cache.delete(self.lock_key)
+
+    def load(self):
+        return cache.get(self.cache_key)
+
+    def store(self, response):
+        headers = {name: response[name] for name in STORED_HEADERS if name in response}
+        cache.set(self.cache_key, {
+            "fingerprint": self.fingerprint,
+            "status": response.status_code,
+            "headers": headers,
+            "content": response.content,
+        }, self.timeout)
+
+    @staticmethod
+    def replay(stored):
+        response = HttpResponse(stored["content"], status=stored["status"])
+        for name, value in stored["headers"].items():
+            response[name] = value
+        response[REPLAYED_HEADER] = "true"
+        return response
@@ -0,0 +1,53 @@
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+# Integrations talk to third-party services through client libraries that are
+# slow to import (tweepy pulls in requests, oauthlib and more). Each one is
+# named here by the setting holding its class's dotted path, and is imported
+# and built the first time get() asks for it, then shared by the process. Code
+# that runs at startup (models, views, signals, urls) must go through get()
+# rather than import an integration module; see startup.py for the guard.
+REGISTRY = {
+    "announcements": ("ANNOUNCEMENT_TRANSPORT", "chiecouture.twitter_client.XTransport"),
+}
+
+_instances = {}
+_lock = threading.Lock()
+
+
+def register(name, setting, default):
+    """Add an integration built from the class named by `setting` (default: `default`)."""
+    REGISTRY[name] = (setting, default)
+    _instances.pop(name, None)
+
+
+def get(name):
+    """The process-wide instance of integration `name`, built on first use."""
+    try:
+        return _instances[name]
+    except KeyError:
+        pass
+    setting, default = REGISTRY[name]
+    with _lock:
+        if name not in _instances:
+            _instances[name] = import_string(getattr(settings, setting, default))()
+    return _instances[name]
+
+
+def reset(name=None):
+    """Drop built instances (all, or just `name`) so the next get() rebuilds them."""
+    if name is None:
+        _instances.clear()
+    else:
+        _instances.pop(name, None)
+
+
+@receiver(setting_changed)
+def reset_changed_integration(setting, **kwargs):
+    for name, (integration_setting, _) in REGISTRY.items():
+        if integration_setting == setting:
+            reset(name)
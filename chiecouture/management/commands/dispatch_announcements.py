@@ -0,0 +1,11 @@
+from chiecouture.announcements import DEFAULT_BATCH_SIZE, dispatch_batch
+from chiecouture.management.workers import QueueWorkerCommand
+
+
+class Command(QueueWorkerCommand):
+    help = "Post queued store and product announcements, in batches."
+    process_batch = staticmethod(dispatch_batch)
+    default_batch_size = DEFAULT_BATCH_SIZE
+    default_interval = 30.0
+    items = "announcements"
+    summary = "Posted {sent} {items}, {failed} failed."
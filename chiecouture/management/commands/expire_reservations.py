@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from chiecouture.reservations import DEFAULT_BATCH_SIZE, release_expired
+
+
+class Command(BaseCommand):
+    help = "Release expired stock reservations in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        total = 0
+        while released := release_expired(options["batch_size"]):
+            total += released
+        self.stdout.write(self.style.SUCCESS(f"Released {total} expired reservations."))
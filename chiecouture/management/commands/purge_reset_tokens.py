@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from chiecouture.models import PasswordResetToken
+
+
+class Command(BaseCommand):
+    help = "Delete expired password reset tokens in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = 0
+        while deleted := PasswordResetToken.purge_expired(options["batch_size"]):
+            total += deleted
+        self.stdout.write(self.style.SUCCESS(f"Deleted {total} expired reset tokens."))
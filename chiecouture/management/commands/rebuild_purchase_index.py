@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from chiecouture.models import OrderItem, Purchase
+
+
+class Command(BaseCommand):
+    help = "Fill the purchase index from existing orders (safe to run again)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Purchases inserted per query."
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        pairs = (
+            OrderItem.objects.filter(product__isnull=False)
+            .values_list("order__user_id", "product_id")
+            .distinct()
+            .order_by()
+        )
+        batch = []
+        seen = 0
+        for user_id, product_id in pairs.iterator(chunk_size=batch_size):
+            batch.append(Purchase(user_id=user_id, product_id=product_id))
+            if len(batch) >= batch_size:
+                Purchase.objects.bulk_create(batch, ignore_conflicts=True)
+                seen += len(batch)
+                batch = []
+        if batch:
+            Purchase.objects.bulk_create(batch, ignore_conflicts=True)
+            seen += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {seen} purchases."))
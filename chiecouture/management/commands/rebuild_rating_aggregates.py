@@ -0,0 +1,56 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from chiecouture.models import Product, Review
+
+
+class Command(BaseCommand):
+    help = "Recompute every product's review count, rating sum, average and histogram."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Products updated per query."
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        histogram = {
+            field: Count("id", filter=Q(rating=rating))
+            for rating, field in Product.RATING_COUNT_FIELDS.items()
+        }
+        totals = {
+            row["product_id"]: row
+            for row in Review.objects.values("product_id").annotate(
+                review_count=Count("id"), rating_sum=Sum("rating"), **histogram
+            )
+        }
+        counters = ["review_count", "rating_sum", *Product.RATING_COUNT_FIELDS.values()]
+        empty = dict.fromkeys(counters, 0)
+        fields = [*counters, "rating_average"]
+
+        updated = 0
+        batch = []
+        products = Product.objects.only("id", *fields).order_by("id")
+        with transaction.atomic():
+            for product in products.iterator(chunk_size=batch_size):
+                row = totals.get(product.id, empty)
+                for field in counters:
+                    setattr(product, field, row[field] or 0)
+                product.rating_average = (
+                    round(Decimal(product.rating_sum) / product.review_count, 2)
+                    if product.review_count
+                    else None
+                )
+                batch.append(product)
+                if len(batch) >= batch_size:
+                    Product.objects.bulk_update(batch, fields)
+                    updated += len(batch)
+                    batch = []
+            if batch:
+                Product.objects.bulk_update(batch, fields)
+                updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {updated} products."))
@@ -0,0 +1,49 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from chiecouture.renditions import IMAGE_FIELDS, render_field, save_widths
+
+
+def _render(job):
+    model_label, field_name, pk, name = job
+    try:
+        return pk, render_field(model_label, field_name, name)
+    except (OSError, ValueError):
+        return pk, None
+
+
+class Command(BaseCommand):
+    help = "Regenerate the image renditions of every product and store, across processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count(),
+            help="Worker processes (default: one per CPU).",
+        )
+
+    def handle(self, *args, **options):
+        # Workers only read and write media files; the database is updated
+        # here, so the connections are closed rather than shared with them.
+        connections.close_all()
+        total = failed = 0
+        with ProcessPoolExecutor(max_workers=options["workers"], initializer=django.setup) as pool:
+            for model, (field_name, _) in IMAGE_FIELDS.items():
+                rows = (
+                    model.objects.exclude(**{field_name: ""}).exclude(**{field_name: None})
+                    .order_by("pk").values_list("pk", field_name)
+                )
+                jobs = [(model._meta.label, field_name, pk, name) for pk, name in rows]
+                widths = {}
+                for pk, result in pool.map(_render, jobs, chunksize=8):
+                    if result is None:
+                        failed += 1
+                        self.stderr.write(f"Could not render {model._meta.label} #{pk}")
+                    else:
+                        widths[pk] = result
+                save_widths(model, widths)
+                total += len(widths)
+        self.stdout.write(self.style.SUCCESS(f"Rendered {total} images, {failed} failed."))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from chiecouture.models import Product
+from chiecouture.search import index_products
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search document of every product."
+
+    def handle(self, *args, **options):
+        indexed = index_products(Product.objects.all())
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} products."))
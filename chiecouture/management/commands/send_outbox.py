@@ -0,0 +1,9 @@
+from chiecouture.outbox import DEFAULT_BATCH_SIZE, deliver_batch
+from chiecouture.management.workers import QueueWorkerCommand
+
+
+class Command(QueueWorkerCommand):
+    help = "Send queued emails from the outbox, in batches over one mail connection."
+    process_batch = staticmethod(deliver_batch)
+    default_batch_size = DEFAULT_BATCH_SIZE
+    items = "emails"
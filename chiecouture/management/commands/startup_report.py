@@ -0,0 +1,38 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from chiecouture.startup import LAZY_MODULES, measure_startup
+
+
+class Command(BaseCommand):
+    help = "Time django.setup() plus the URLconf and list the slowest imports."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit", type=int, default=20, help="How many modules and packages to list."
+        )
+
+    def handle(self, *args, **options):
+        limit = options["limit"]
+        wall = measure_startup().seconds
+        report = measure_startup(importtime=True)
+
+        self.stdout.write(f"Startup: {wall * 1000:.0f} ms wall clock")
+        self.stdout.write(f"\nSlowest imports (cumulative, top {limit}):")
+        slowest = sorted(report.imports, key=lambda i: i.cumulative_us, reverse=True)
+        for item in slowest[:limit]:
+            self.stdout.write(f"{item.cumulative_us / 1000:9.1f} ms  {item.module}")
+
+        packages = Counter()
+        for item in report.imports:
+            packages[item.module.split(".")[0]] += item.self_us
+        self.stdout.write(f"\nPackages by own import time (top {limit}):")
+        for package, us in packages.most_common(limit):
+            self.stdout.write(f"{us / 1000:9.1f} ms  {package}")
+
+        loaded = sorted(name for name in LAZY_MODULES if name in report.modules)
+        if loaded:
+            self.stdout.write(self.style.WARNING(
+                f"\nImported at startup but meant to load on first use: {', '.join(loaded)}"
+            ))
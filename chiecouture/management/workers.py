@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class QueueWorkerCommand(BaseCommand):
+    """
+    Management command draining a queue with `process_batch` (a staticmethod
+    returning (sent, failed)), and with --watch polling it every --interval
+    seconds.
+    """
+    process_batch = None
+    default_batch_size = 100
+    default_interval = 5.0
+    items = "items"
+    summary = "Sent {sent} {items}, {failed} failed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=self.default_batch_size)
+        parser.add_argument(
+            "--watch", action="store_true",
+            help=f"Keep polling for new {self.items} instead of exiting once the queue is drained.",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=self.default_interval,
+            help="Seconds between polls with --watch.",
+        )
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = self.process_batch(options["batch_size"])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                continue
+            if not options["watch"]:
+                break
+            time.sleep(options["interval"])
+        self.stdout.write(self.style.SUCCESS(
+            self.summary.format(sent=total_sent, failed=total_failed, items=self.items)
+        ))
@@ -0,0 +1,210 @@
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import JsonResponse
+from django.template.backends.django import Template
+
+from .idempotency import (
+    HEADER, MAX_KEY_LENGTH, IdempotencyRecord, is_idempotent_view, request_scope,
+)
+
+logger = logging.getLogger("chiecouture.metrics")
+
+_current = ContextVar("request_metrics", default=None)
+_template_render = None
+
+
+class RequestMetrics:
+    """Counters for a single request, filled in by RequestMetricsMiddleware."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        # SQL run while a template renders counts as template time too.
+        self.template_sql_seconds = 0.0
+        self.rendering = 0
+        self.view_started = None
+        self._timed_before_view = 0.0
+        self.view_seconds = 0.0
+        self.statements = Counter()
+
+    @property
+    def timed_elsewhere(self):
+        """Seconds reported separately as db or tpl, each counted once."""
+        return self.sql_seconds - self.template_sql_seconds + self.template_seconds
+
+    def start_view(self):
+        self.view_started = time.perf_counter()
+        self._timed_before_view = self.timed_elsewhere
+
+    def stop_view(self):
+        """The view's own time: from process_view on, less SQL and template time."""
+        if self.view_started is not None:
+            elapsed = time.perf_counter() - self.view_started
+            self.view_seconds = max(elapsed - (self.timed_elsewhere - self._timed_before_view), 0.0)
+
+    @property
+    def duplicates(self):
+        """Number of queries that repeated an earlier query with the same SQL and params."""
+        return sum(count - 1 for count in self.statements.values())
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.sql_seconds += elapsed
+            if self.rendering:
+                self.template_sql_seconds += elapsed
+            self.queries += 1
+            self.statements[(sql, repr(params))] += 1
+
+
+def _timed_template_render(self, context=None, request=None):
+    metrics = _current.get()
+    if metrics is None:
+        return _template_render(self, context, request)
+    started = time.perf_counter()
+    metrics.rendering += 1
+    try:
+        return _template_render(self, context, request)
+    finally:
+        metrics.rendering -= 1
+        metrics.template_seconds += time.perf_counter() - started
+
+
+def _instrument_templates():
+    global _template_render
+    if _template_render is None:
+        _template_render = Template.render
+        Template.render = _timed_template_render
+
+
+class RequestMetricsMiddleware:
+    """
+    Per-request query count, SQL time, duplicate queries, template and view time.
+    View time is the view's own work, so the three timings add up to no more
+    than the total.
+
+    The numbers are sent back as a Server-Timing header and, for a sample of
+    requests (REQUEST_METRICS_LOG_SAMPLE_RATE), logged as one JSON line on the
+    "chiecouture.metrics" logger. When REQUEST_METRICS_ENABLED is off the
+    middleware removes itself at startup, so it costs nothing.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "REQUEST_METRICS_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "REQUEST_METRICS_LOG_SAMPLE_RATE", 0.0)
+        _instrument_templates()
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.record_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - started
+        metrics.stop_view()
+
+        response["Server-Timing"] = ", ".join([
+            f'db;dur={metrics.sql_seconds * 1000:.1f};desc="{metrics.queries} queries, '
+            f'{metrics.duplicates} duplicate"',
+            f"tpl;dur={metrics.template_seconds * 1000:.1f}",
+            f"view;dur={metrics.view_seconds * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ])
+        if self.sample_rate and random.random() < self.sample_rate:
+            self.log(request, response, metrics, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.start_view()
+
+    def log(self, request, response, metrics, total):
+        match = getattr(request, "resolver_match", None)
+        logger.info(json.dumps({
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "queries": metrics.queries,
+            "duplicate_queries": metrics.duplicates,
+            "sql_ms": round(metrics.sql_seconds * 1000, 2),
+            "template_ms": round(metrics.template_seconds * 1000, 2),
+            "view_ms": round(metrics.view_seconds * 1000, 2),
+            "total_ms": round(total * 1000, 2),
+        }))
+
+
+class IdempotencyMiddleware:
+    """
+    Make retried POSTs to @idempotent views safe. The first response for an
+    Idempotency-Key (per client, method and path) is stored in the cache for
+    IDEMPOTENCY_KEY_TTL seconds and replayed for later requests with that key
+    without running the view again. A retry that arrives while the first
+    request is still running gets 409; reusing a key with a different body
+    gets 422. Server errors are not stored, so they can be retried. Anonymous
+    clients without a session are served without idempotency.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        record = getattr(request, "_idempotency_record", None)
+        if record is not None:
+            if response.status_code < 500 and not response.streaming:
+                record.store(response)
+            record.release()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        key = request.headers.get(HEADER)
+        if request.method != "POST" or not key or not is_idempotent_view(request, view_func):
+            return None
+        if len(key) > MAX_KEY_LENGTH:
+            return JsonResponse({"detail": f"{HEADER} is too long."}, status=400)
+
+        scope = request_scope(request)
+        if scope is None:
+            return None
+        record = IdempotencyRecord(request, key, scope)
+        stored = record.load()
+        if stored is None:
+            if not record.acquire():
+                return JsonResponse(
+                    {"detail": f"A request with this {HEADER} is still being processed."},
+                    status=409,
+                )
+            # The first request may have finished between load() and acquire().
+            stored = record.load()
+            if stored is None:
+                request._idempotency_record = record
+                return None
+            record.release()
+        if stored["fingerprint"] != record.fingerprint:
+            return JsonResponse(
+                {"detail": f"This {HEADER} was already used with a different request."},
+                status=422,
+            )
+        return IdempotencyRecord.replay(stored)
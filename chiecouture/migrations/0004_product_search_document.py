@@ -0,0 +1,85 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FTS_TABLE = "chiecouture_productsearch_fts"
+DOCUMENT_TABLE = "chiecouture_productsearchdocument"
+
+SQLITE_FTS_SQL = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    f"document, content='{DOCUMENT_TABLE}', content_rowid='product_id')",
+    f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {DOCUMENT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, document) VALUES (new.product_id, new.document); END",
+    f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {DOCUMENT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, document) "
+    f"VALUES ('delete', old.product_id, old.document); END",
+    f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {DOCUMENT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, document) "
+    f"VALUES ('delete', old.product_id, old.document); "
+    f"INSERT INTO {FTS_TABLE}(rowid, document) VALUES (new.product_id, new.document); END",
+]
+
+
+def create_fulltext_index(apps, schema_editor):
+    """MySQL gets a FULLTEXT index, SQLite an FTS5 table; other backends fall back to LIKE."""
+    connection = schema_editor.connection
+    if connection.vendor == "mysql":
+        schema_editor.execute(
+            f"ALTER TABLE {DOCUMENT_TABLE} ADD FULLTEXT INDEX product_search_document_ft (document)"
+        )
+    elif connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA compile_options")
+            if "ENABLE_FTS5" not in {row[0] for row in cursor.fetchall()}:
+                return
+        for sql in SQLITE_FTS_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for name in ("ai", "ad", "au"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{name}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def index_existing_products(apps, schema_editor):
+    Product = apps.get_model("chiecouture", "Product")
+    ProductSearchDocument = apps.get_model("chiecouture", "ProductSearchDocument")
+    batch = []
+    for product in Product.objects.select_related("store").iterator(chunk_size=1000):
+        document = "\n".join([product.name, product.store.name, product.description])
+        batch.append(ProductSearchDocument(product_id=product.id, document=document))
+        if len(batch) >= 1000:
+            ProductSearchDocument.objects.bulk_create(batch)
+            batch = []
+    ProductSearchDocument.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chiecouture", "0003_product_rating_aggregates"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductSearchDocument",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_document",
+                        serialize=False,
+                        to="chiecouture.product",
+                    ),
+                ),
+                ("document", models.TextField()),
+            ],
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(index_existing_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:25
+
+from django.db import migrations, models
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+
+def fill_rating_average(apps, schema_editor):
+    Product = apps.get_model("chiecouture", "Product")
+    Product.objects.filter(review_count__gt=0).update(
+        rating_average=Cast("rating_sum", FloatField()) / F("review_count")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chiecouture", "0004_product_search_document"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="rating_average",
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=3, null=True),
+        ),
+        migrations.RunPython(fill_rating_average, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["price", "stock"], name="product_price_stock_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["store", "price"], name="product_store_price_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["stock", "price"], name="product_stock_price_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["rating_average", "price"], name="product_rating_price_idx"),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-17 15:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_snapshots(apps, schema_editor):
+    OrderItem = apps.get_model("chiecouture", "OrderItem")
+    Product = apps.get_model("chiecouture", "Product")
+    product = Product.objects.filter(pk=OuterRef("product_id"))
+    OrderItem.objects.update(
+        product_name=Subquery(product.values("name")[:1]),
+        store_id=Subquery(product.values("store_id")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chiecouture", "0008_stock_reservations"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="orderitem",
+            name="product_name",
+            field=models.CharField(default="", max_length=255),
+        ),
+        migrations.AddField(
+            model_name="orderitem",
+            name="store",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="chiecouture.store",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="orderitem",
+            name="product",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="chiecouture.product",
+            ),
+        ),
+        migrations.RunPython(fill_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.6 on 2026-10-17 15:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_stores(apps, schema_editor):
+    Review = apps.get_model("chiecouture", "Review")
+    Product = apps.get_model("chiecouture", "Product")
+    product = Product.objects.filter(pk=OuterRef("product_id"))
+    Review.objects.update(store_id=Subquery(product.values("store_id")[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chiecouture", "0010_purchase_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="review",
+            name="store",
+            field=models.ForeignKey(
+                db_index=False,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="reviews",
+                to="chiecouture.store",
+            ),
+        ),
+        migrations.RunPython(fill_stores, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="review",
+            name="store",
+            field=models.ForeignKey(
+                db_index=False,
+                editable=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="reviews",
+                to="chiecouture.store",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(
+                fields=["product", "-created_at", "-id"], name="review_product_recent_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(
+                fields=["store", "-created_at", "-id"], name="review_store_recent_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 15:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chiecouture", "0012_announcements"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="image_widths",
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name="store",
+            name="logo_widths",
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chiecouture", "0014_stored_files"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="passwordresettoken",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, F, FloatField, Value, When
+from django.db.models.functions import Cast, Now, Round
 from django.utils import timezone
 import uuid
 
@@ -25,6 +28,9 @@ class Store(models.Model):
     owner = models.OneToOneField("User", on_delete=models.CASCADE, related_name="store")
     description = models.TextField(blank=True)
     logo = models.ImageField(upload_to="store_logos/", blank=True, null=True)
+    # Widths of the renditions made from logo (see renditions.py).
+    logo_widths = models.JSONField(default=list, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -37,15 +43,107 @@ class Product(models.Model):
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
+    # Units held by unexpired StockReservations; never more than stock.
+    reserved_stock = models.PositiveIntegerField(default=0)
     image = models.ImageField(upload_to="products/", blank=True)
+    # Widths of the renditions made from image (see renditions.py).
+    image_widths = models.JSONField(default=list, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Review aggregates, maintained by the Review signals in signals.py.
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+    # rating_sum / review_count, stored so "min rating" filters can use an index.
+    rating_average = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True)
+
+    RATING_COUNT_FIELDS = {
+        1: "rating_1_count",
+        2: "rating_2_count",
+        3: "rating_3_count",
+        4: "rating_4_count",
+        5: "rating_5_count",
+    }
+
+    class Meta:
+        # Composite indexes for the catalog facets in facets.py: each store,
+        # stock and rating facet is a range scan that can also narrow on price.
+        indexes = [
+            models.Index(fields=["price", "stock"], name="product_price_stock_idx"),
+            models.Index(fields=["store", "price"], name="product_store_price_idx"),
+            models.Index(fields=["stock", "price"], name="product_stock_price_idx"),
+            models.Index(fields=["rating_average", "price"], name="product_rating_price_idx"),
+            # Conditional GET validators for a store's product list (conditional.py).
+            models.Index(fields=["store", "updated_at"], name="product_store_updated_idx"),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.store.name}"
 
+    @property
+    def available_stock(self):
+        """Units that can still be reserved or ordered."""
+        return max(self.stock - self.reserved_stock, 0)
+
+    @property
+    def rating_histogram(self):
+        """Number of reviews per star rating, keyed 1 to 5."""
+        return {rating: getattr(self, field) for rating, field in self.RATING_COUNT_FIELDS.items()}
+
+    @classmethod
+    def adjust_rating_aggregates(cls, product_id, rating, delta):
+        """
+        Add (delta=1) or remove (delta=-1) one review of `rating` from a product's
+        aggregates with in-place UPDATEs, so concurrent reviews never lose a count.
+        """
+        products = cls.objects.filter(pk=product_id)
+        with transaction.atomic():
+            updated = products.update(
+                updated_at=Now(),
+                review_count=F("review_count") + delta,
+                rating_sum=F("rating_sum") + delta * rating,
+                **{cls.RATING_COUNT_FIELDS[rating]: F(cls.RATING_COUNT_FIELDS[rating]) + delta},
+            )
+            products.update(rating_average=cls.rating_average_expression())
+        return updated
+
+    @staticmethod
+    def rating_average_expression():
+        """SQL expression computing rating_average from the stored sum and count."""
+        return Case(
+            When(review_count=0, then=Value(None)),
+            default=Round(Cast("rating_sum", FloatField()) / F("review_count"), 2),
+            output_field=DecimalField(max_digits=3, decimal_places=2),
+        )
+
+
+class ProductSearchDocument(models.Model):
+    """
+    Searchable text for a product (name, store name, description) kept in its own
+    table so it can carry a FULLTEXT (MySQL) or FTS5 (SQLite) index. See search.py.
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name="search_document"
+    )
+    document = models.TextField()
+
+    def __str__(self):
+        return f"Search document for product #{self.product_id}"
+
 
 class Review(models.Model):
-    """Reviews left by buyers for products."""
+    """
+    Reviews left by buyers for products. The product's store is copied onto the
+    review when it is saved, so a store's reviews are read from one index.
+    """
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reviews")
+    # Covered by review_store_recent_idx, so no index of its own.
+    store = models.ForeignKey(
+        Store, on_delete=models.CASCADE, related_name="reviews", editable=False, db_index=False
+    )
     user = models.ForeignKey("User", on_delete=models.CASCADE, related_name="reviews")
     rating = models.PositiveIntegerField(
         validators=[MinValueValidator(1), MaxValueValidator(5)]
@@ -53,10 +151,27 @@ class Review(models.Model):
     comment = models.TextField()
     verified = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Conditional GET validators for a product's reviews (conditional.py).
+            models.Index(fields=["product", "updated_at"], name="review_product_updated_idx"),
+            # Newest-first review pages of a product and of a store (pagination.REVIEW_ORDERING).
+            models.Index(
+                fields=["product", "-created_at", "-id"], name="review_product_recent_idx"
+            ),
+            models.Index(fields=["store", "-created_at", "-id"], name="review_store_recent_idx"),
+        ]
 
     def __str__(self):
         return f"Review by {self.user.username} on {self.product.name}"
 
+    def save(self, *args, **kwargs):
+        if self.store_id is None:
+            self.store_id = self.product.store_id
+        super().save(*args, **kwargs)
+
 
 class Cart(models.Model):
     """Shopping cart for buyers (1 per user)."""
@@ -76,6 +191,21 @@ class CartItem(models.Model):
         return f"{self.quantity} × {self.product.name}"
 
 
+class StockReservation(models.Model):
+    """
+    Units of a product held for a buyer between starting checkout and placing
+    the order. Held units are counted in Product.reserved_stock; expired holds
+    are released by the expire_reservations command (see reservations.py).
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reservations")
+    user = models.ForeignKey("User", on_delete=models.CASCADE, related_name="reservations")
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.quantity} × {self.product_id} held for user {self.user_id}"
+
+
 class Order(models.Model):
     """Order created during checkout."""
     user = models.ForeignKey("User", on_delete=models.CASCADE, related_name="orders")
@@ -87,25 +217,140 @@ class Order(models.Model):
 
 
 class OrderItem(models.Model):
-    """Individual items in an order."""
+    """
+    Individual items in an order. The product's name, store and unit price are
+    copied at checkout, so order history never reads (or depends on) live
+    product rows; the product link is cleared if the product is deleted.
+    """
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
-    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True)
+    product_name = models.CharField(max_length=255, default="")
+    store = models.ForeignKey(
+        Store, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
     def __str__(self):
-        return f"{self.quantity} × {self.product.name} (Order #{self.order.id})"
+        return f"{self.quantity} × {self.product_name} (Order #{self.order_id})"
+
+
+class Purchase(models.Model):
+    """
+    One row per (user, product) the user has ordered, written at checkout.
+    The composite primary key makes "did this user buy this product?" a
+    single primary-key lookup.
+    """
+    pk = models.CompositePrimaryKey("user_id", "product_id")
+    user = models.ForeignKey("User", on_delete=models.CASCADE, related_name="purchases")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+
+    @classmethod
+    def record(cls, user_id, product_ids):
+        """Add purchases, ignoring ones that are already recorded."""
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, product_id=product_id) for product_id in product_ids],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def has_bought(cls, user, product):
+        return cls.objects.filter(pk=(user.pk, product.pk)).exists()
+
+    def __str__(self):
+        return f"User {self.user_id} bought product {self.product_id}"
 
 
 class PasswordResetToken(models.Model):
-    """Token for secure password reset (expires after 24 hours)."""
+    """
+    Token for secure password reset (expires after PASSWORD_RESET_TIMEOUT, like
+    signed links). Only written when PASSWORD_RESET_TOKEN_MODE is "table";
+    signed links need no row.
+    """
+    LIFETIME = timezone.timedelta(seconds=settings.PASSWORD_RESET_TIMEOUT)
+
     user = models.ForeignKey("User", on_delete=models.CASCADE, related_name="reset_tokens")
     token = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def is_valid(self):
-        """Check if token is still valid (24 hours)."""
-        return timezone.now() - self.created_at < timezone.timedelta(hours=24)
+        """Check if token is still valid (LIFETIME)."""
+        return timezone.now() - self.created_at < self.LIFETIME
+
+    @classmethod
+    def purge_expired(cls, batch_size=1000):
+        """Delete one batch of expired tokens, oldest first; return how many were deleted."""
+        batch = (
+            cls.objects.filter(created_at__lte=timezone.now() - cls.LIFETIME)
+            .order_by("created_at").values_list("pk", flat=True)[:batch_size]
+        )
+        return cls.objects.filter(pk__in=list(batch)).delete()[0]
 
     def __str__(self):
         return f"Password reset token for {self.user.username}"
+
+
+class OutboxEmail(models.Model):
+    """
+    An email waiting to be sent by the send_outbox worker. Rows are written in
+    the same transaction as the change they report, so an email goes out if and
+    only if that change was committed.
+    """
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["sent_at", "next_attempt_at"], name="outbox_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)}"
+
+
+class Announcement(models.Model):
+    """
+    A social post about a new store or product, waiting for the
+    dispatch_announcements worker. There is at most one per object, so saving
+    or signalling the same object twice never posts twice.
+    """
+    KIND_CHOICES = (("store", "Store"), ("product", "Product"))
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    text = models.CharField(max_length=280)
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "object_id"], name="announcement_once_idx"),
+        ]
+        indexes = [
+            models.Index(fields=["sent_at", "next_attempt_at"], name="announcement_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id}: {self.text}"
+
+
+class StoredFile(models.Model):
+    """
+    A file in ContentAddressedStorage and how many saves share it: identical
+    uploads are stored once, and the file is removed when the last is deleted.
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+    references = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.references} references)"
@@ -0,0 +1,83 @@
+import hashlib
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.http import Http404
+
+from .models import Product, Store
+from .versions import bump_version, get_versions
+
+
+class ObjectCache:
+    """
+    Read-through cache of single rows by primary key.
+
+    Rows are cached as a plain tuple of column values and turned back into model
+    instances with Model.from_db. Keys carry a per-object version that is bumped
+    on save/delete (see signals.py), so a reader that loaded a row just before a
+    write can only store it under the old version, where nobody will read it.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.attnames = [field.attname for field in model._meta.concrete_fields]
+        # Changing the model's columns changes every key, so old tuples are ignored.
+        schema = hashlib.md5(",".join(self.attnames).encode(), usedforsecurity=False)
+        self.prefix = f"obj:{model._meta.label_lower}:{schema.hexdigest()[:8]}"
+        self.stats = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        return getattr(settings, "OBJECT_CACHE_TIMEOUT", 300)
+
+    def _version_key(self, pk):
+        return f"{self.prefix}:v:{pk}"
+
+    def _count(self, outcome):
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def _version(self, pk):
+        version_key = self._version_key(pk)
+        return get_versions([version_key])[version_key]
+
+    def get(self, pk):
+        """Return the instance with primary key `pk`, or None if there is no such row."""
+        key = f"{self.prefix}:{pk}:{self._version(pk)}"
+        row = cache.get(key)
+        if row is not None:
+            self._count("hits")
+        else:
+            self._count("misses")
+            row = self.model.objects.filter(pk=pk).values_list(*self.attnames).first()
+            if row is None:
+                return None
+            cache.set(key, tuple(row), self.timeout)
+        return self.model.from_db(DEFAULT_DB_ALIAS, self.attnames, row)
+
+    def invalidate(self, pk):
+        """
+        Retire the cached copy of one row, now and again once the surrounding
+        transaction commits (a read in between may cache the pre-commit row).
+        """
+        def bump():
+            bump_version(self._version_key(pk))
+
+        bump()
+        transaction.on_commit(bump)
+
+
+store_cache = ObjectCache(Store)
+product_cache = ObjectCache(Product)
+
+
+def get_cached_or_404(object_cache, pk):
+    """Like get_object_or_404, but read through `object_cache`."""
+    obj = object_cache.get(pk)
+    if obj is None:
+        raise Http404(f"No {object_cache.model._meta.object_name} matches the given query.")
+    return obj
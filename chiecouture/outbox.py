@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+from .models import OutboxEmail
+from .queues import claim_batch, finish_batch
+
+DEFAULT_BATCH_SIZE = 100
+
+
+def queue_email(subject, body, recipients, from_email=None):
+    """
+    Add an email to the outbox. Call it inside the transaction that makes the
+    change the email is about; the send_outbox worker delivers it after commit.
+    """
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipients),
+    )
+
+
+def deliver_batch(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Send one batch of due emails over a single mail connection.
+    Returns (sent, failed); failed emails are retried later with backoff.
+    """
+    batch = claim_batch(OutboxEmail, "OUTBOX", batch_size)
+    if not batch:
+        return 0, 0
+
+    sent, failed = [], []
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+        for email in batch:
+            message = EmailMessage(
+                email.subject, email.body, email.from_email, email.recipients,
+                connection=connection,
+            )
+            try:
+                message.send()
+            except Exception as e:
+                email.last_error = str(e)
+                failed.append(email)
+            else:
+                sent.append(email)
+    except Exception as e:
+        # The connection itself failed: everything not yet sent is retried.
+        for email in batch:
+            if email not in sent and email not in failed:
+                email.last_error = str(e)
+                failed.append(email)
+    finally:
+        connection.close()
+
+    return finish_batch(OutboxEmail, "OUTBOX", sent, failed)
@@ -0,0 +1,154 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+from rest_framework.pagination import CursorPagination
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+# Newest first; id breaks ties between reviews posted in the same instant.
+REVIEW_ORDERING = ("-created_at", "-id")
+
+
+def encode_cursor(values):
+    """Encode the ordering values of the last row on a page into an opaque token."""
+    plain = []
+    for value in values:
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        plain.append(value)
+    raw = json.dumps(plain, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Decode a token produced by encode_cursor; raise ValueError if it is malformed."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def clamp_page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Parse a client supplied page size, falling back to the default and capping it."""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    if size < 1:
+        return default
+    return min(size, maximum)
+
+
+def _after(ordering, values):
+    """
+    Build the keyset predicate selecting rows strictly after `values`.
+    For ordering (a, -b) this is: a > va OR (a = va AND b < vb).
+    """
+    if len(values) != len(ordering):
+        raise ValueError("Invalid cursor")
+    predicate = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        predicate |= equal & Q(**{f"{name}__{lookup}": value})
+        equal &= Q(**{name: value})
+    return predicate
+
+
+class KeysetPage:
+    """One page of a keyset-paginated queryset, iterable like a list."""
+
+    def __init__(self, object_list, next_cursor, page_size, query=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.page_size = page_size
+        self._query = query
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def first_query(self):
+        """Query string for the first page, keeping any other GET parameters."""
+        if self._query is None:
+            return ""
+        query = self._query.copy()
+        query.pop("cursor", None)
+        return query.urlencode()
+
+    @property
+    def next_query(self):
+        """Query string for the next page, keeping any other GET parameters."""
+        if self._query is None or not self.has_next:
+            return ""
+        query = self._query.copy()
+        query["cursor"] = self.next_cursor
+        return query.urlencode()
+
+
+def keyset_paginate(request, queryset, ordering=("id",), page_size=None):
+    """
+    Return a KeysetPage for `queryset` using the `cursor`/`page_size` GET parameters.
+
+    Rows are located with a WHERE on the ordering columns instead of an OFFSET, so
+    the cost of a page does not grow with how deep into the results it is.
+    """
+    size = page_size or clamp_page_size(request.GET.get("page_size"))
+    queryset = queryset.order_by(*ordering)
+    token = request.GET.get("cursor")
+    if token:
+        try:
+            queryset = queryset.filter(_after(ordering, decode_cursor(token)))
+        except (ValueError, TypeError, ValidationError):
+            raise Http404("Invalid cursor")
+    rows = list(queryset[: size + 1])
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, f.lstrip("-")) for f in ordering])
+    return KeysetPage(rows, next_cursor, size, query=request.GET)
+
+
+class CatalogCursorPagination(CursorPagination):
+    """Keyset pagination for the catalog endpoints, ordered by primary key."""
+
+    ordering = "id"
+    page_size = DEFAULT_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = MAX_PAGE_SIZE
+
+
+class OrderCursorPagination(CatalogCursorPagination):
+    """Order history, newest first."""
+
+    ordering = "-id"
+
+
+class ReviewCursorPagination(CatalogCursorPagination):
+    """Review streams, newest first; a page's `next` link loads more."""
+
+    ordering = REVIEW_ORDERING
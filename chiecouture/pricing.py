@@ -0,0 +1,96 @@
+from collections import namedtuple
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import DecimalField, ExpressionWrapper, F
+
+from .models import CartItem
+from .versions import bump_version, get_versions
+
+# Priced carts are cached under the cart's version and a catalogue-wide price
+# version. Changing a cart's items bumps the first (see carts.py and
+# checkout.py), changing a product's price, name or store or deleting a
+# product bumps the second (see signals.py), so a cached pricing is never read
+# after either changed.
+CACHE_TIMEOUT = 60 * 60
+PRICES_VERSION_KEY = "cart-pricing:prices-version"
+
+CartLine = namedtuple("CartLine", "item_id product_id store_id name price quantity line_total")
+
+
+class CartPricing:
+    """The priced lines of one cart with their subtotal and item count, iterable like a list."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.subtotal = sum((line.line_total for line in lines), Decimal("0.00"))
+        self.item_count = sum(line.quantity for line in lines)
+
+    @property
+    def quantities(self):
+        """Total quantity per product id."""
+        quantities = {}
+        for line in self.lines:
+            quantities[line.product_id] = quantities.get(line.product_id, 0) + line.quantity
+        return quantities
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __bool__(self):
+        return bool(self.lines)
+
+
+def _cart_version_key(cart_id):
+    return f"cart-pricing:cart-version:{cart_id}"
+
+
+def bump_cart_version(cart_id):
+    """Invalidate the cached pricing of one cart after its items changed."""
+    bump_version(_cart_version_key(cart_id))
+
+
+def bump_prices_version():
+    """Invalidate every cached cart pricing after a product's price, name or store changed."""
+    bump_version(PRICES_VERSION_KEY)
+
+
+def _price_lines(cart_id):
+    line_total = ExpressionWrapper(
+        F("product__price") * F("quantity"),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+    rows = (
+        CartItem.objects.filter(cart_id=cart_id)
+        .annotate(line_total=line_total)
+        .order_by("id")
+        .values_list(
+            "id", "product_id", "product__store_id", "product__name", "product__price",
+            "quantity", "line_total",
+        )
+    )
+    return [CartLine(*row) for row in rows]
+
+
+def price_cart(cart_id, cached=True):
+    """
+    Price the cart with id `cart_id` with a single query (line totals are
+    computed by the database in exact decimals). Checkout passes cached=False
+    so orders are always priced from the current rows.
+    """
+    if not cached:
+        return CartPricing(_price_lines(cart_id))
+    version_keys = [_cart_version_key(cart_id), PRICES_VERSION_KEY]
+    versions = get_versions(version_keys)
+    # The field count keeps entries pickled with an older CartLine from being read.
+    key = "cart-pricing:{}:{}:{}:{}".format(
+        len(CartLine._fields), cart_id, *(versions[key] for key in version_keys)
+    )
+    lines = cache.get(key)
+    if lines is None:
+        lines = _price_lines(cart_id)
+        cache.set(key, lines, CACHE_TIMEOUT)
+    return CartPricing(lines)
@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+# The outbox (OutboxEmail) and the announcement queue (Announcement) are
+# database queues with the same columns: next_attempt_at, attempts, last_error
+# and sent_at. Workers claim due rows, send them, then record the outcome here;
+# each queue reads its limits from settings named <PREFIX>_RETRY_DELAY,
+# <PREFIX>_CLAIM_TIMEOUT and <PREFIX>_MAX_ATTEMPTS.
+
+
+def retry_delay(prefix, attempts):
+    """Exponential backoff: <prefix>_RETRY_DELAY seconds, doubled per failed attempt, capped."""
+    base = getattr(settings, f"{prefix}_RETRY_DELAY", 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), base * 64))
+
+
+def claim_batch(model, prefix, batch_size):
+    """
+    Return up to `batch_size` due rows of `model`, oldest first, and push their
+    next attempt past <prefix>_CLAIM_TIMEOUT seconds, so a second worker running
+    at the same time skips them (and a worker that dies mid-batch only delays
+    them).
+    """
+    now = timezone.now()
+    claim_timeout = timedelta(seconds=getattr(settings, f"{prefix}_CLAIM_TIMEOUT", 600))
+    max_attempts = getattr(settings, f"{prefix}_MAX_ATTEMPTS", 5)
+    with transaction.atomic():
+        batch = list(
+            model.objects.select_for_update(skip_locked=True)
+            .filter(sent_at__isnull=True, next_attempt_at__lte=now, attempts__lt=max_attempts)
+            .order_by("next_attempt_at", "id")[:batch_size]
+        )
+        model.objects.filter(pk__in=[row.pk for row in batch]).update(
+            next_attempt_at=now + claim_timeout
+        )
+    return batch
+
+
+def finish_batch(model, prefix, sent, failed):
+    """
+    Mark `sent` rows sent and schedule `failed` ones (with their last_error
+    set) for a retry with backoff. Returns (sent, failed) counts.
+    """
+    now = timezone.now()
+    model.objects.filter(pk__in=[row.pk for row in sent]).update(sent_at=now)
+    for row in failed:
+        row.attempts += 1
+        row.next_attempt_at = now + retry_delay(prefix, row.attempts)
+    model.objects.bulk_update(failed, ["attempts", "next_attempt_at", "last_error"])
+    return len(sent), len(failed)
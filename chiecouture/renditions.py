@@ -0,0 +1,187 @@
+import hashlib
+import logging
+import os
+from io import BytesIO
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from .fragments import bump_card_version
+from .models import Product, Store
+from .object_cache import product_cache, store_cache
+from .storage import is_content_addressed
+
+logger = logging.getLogger(__name__)
+
+# Uploaded images are served through renditions: copies scaled down to each of
+# RENDITION_WIDTHS (never up) in WebP and in a fallback format, stored next to
+# the original as "<name>.<version>.<width>w.<ext>". The widths that exist are
+# kept on the model (Product.image_widths, Store.logo_widths) so building a
+# srcset never touches storage. Pillow is imported on first use (see startup.py).
+RENDITION_WIDTHS = (160, 320, 640, 1280)
+WEBP = "webp"
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg", "png": "png"}
+SAVE_OPTIONS = {
+    "webp": {"quality": 80, "method": 4},
+    "jpeg": {"quality": 82, "optimize": True, "progressive": True},
+    "png": {"optimize": True},
+}
+RESAMPLE = "LANCZOS"
+# Hash of the render settings. With the original's content hash (storage.py)
+# it makes a rendition's name determine its bytes, so an existing rendition is
+# never rewritten; changing the settings gives new names (run rebuild_renditions).
+RENDITION_VERSION = hashlib.md5(
+    repr((sorted(SAVE_OPTIONS.items()), RESAMPLE)).encode(), usedforsecurity=False
+).hexdigest()[:8]
+
+# Image field and widths field per model, and the caches showing them.
+IMAGE_FIELDS = {
+    Product: ("image", "image_widths"),
+    Store: ("logo", "logo_widths"),
+}
+CACHES = {Product: ("product", product_cache), Store: ("store", store_cache)}
+
+
+def fallback_format(name):
+    """PNGs keep their transparency; everything else falls back to JPEG."""
+    return "png" if name.lower().endswith(".png") else "jpeg"
+
+
+def formats(name):
+    return (WEBP, fallback_format(name))
+
+
+def rendition_name(name, width, fmt):
+    stem, _ = os.path.splitext(name)
+    return f"{stem}.{RENDITION_VERSION}.{width}w.{EXTENSIONS[fmt]}"
+
+
+def srcset(field_file, widths, fmt, build_url=None):
+    """The srcset value listing the `fmt` renditions of `field_file`."""
+    build_url = build_url or (lambda url: url)
+    storage = field_file.storage
+    return ", ".join(
+        f"{build_url(storage.url(rendition_name(field_file.name, width, fmt)))} {width}w"
+        for width in widths
+    )
+
+
+def _encode(image, fmt):
+    if fmt == "jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGBA")
+    buffer = BytesIO()
+    image.save(buffer, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+    return buffer.getvalue()
+
+
+def render(storage, name):
+    """
+    Write the renditions of the image `name` in `storage`, replacing earlier
+    ones unless `name` is content-addressed (then existing ones hold the same
+    bytes and are kept). Returns the widths made, smallest first.
+    """
+    from PIL import Image, ImageOps
+
+    with storage.open(name) as original:
+        image = Image.open(original)
+        # JPEGs can be decoded at a fraction of their size, as long as that
+        # still covers the largest rendition either way round.
+        image.draft(image.mode, (RENDITION_WIDTHS[-1], RENDITION_WIDTHS[-1]))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    widths = [width for width in RENDITION_WIDTHS if width < image.width]
+    keep_existing = is_content_addressed(name)
+    for width in widths:
+        missing = [
+            (fmt, rendition_name(name, width, fmt)) for fmt in formats(name)
+            if not (keep_existing and storage.exists(rendition_name(name, width, fmt)))
+        ]
+        if not missing:
+            continue
+        height = max(round(image.height * width / image.width), 1)
+        scaled = image.resize((width, height), Image.Resampling[RESAMPLE])
+        for fmt, rendition in missing:
+            _store(storage, rendition, _encode(scaled, fmt))
+    return widths
+
+
+def _store(storage, name, data):
+    """Write `data` under exactly `name`, as rendition names are derived from the original's."""
+    if hasattr(storage, "save_derived"):
+        storage.save_derived(name, ContentFile(data))
+        return
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(data))
+
+
+def render_field(model_label, field_name, name):
+    """render() for a process pool worker: look the storage up by model and field."""
+    storage = apps.get_model(model_label)._meta.get_field(field_name).storage
+    return render(storage, name)
+
+
+def image_changed(instance):
+    """True if saving `instance` uploads a new image or clears one that had renditions."""
+    field_name, widths_field = IMAGE_FIELDS[type(instance)]
+    field_file = getattr(instance, field_name)
+    if field_file:
+        # Uncommitted until the model's save stores it under its final name.
+        return not field_file._committed
+    return bool(getattr(instance, widths_field))
+
+
+def replaced_image(instance, update_fields=None):
+    """
+    The stored name of the image that saving `instance` replaces or clears,
+    or None. Only queries when the image field was emptied or re-uploaded.
+    """
+    field_name, _ = IMAGE_FIELDS[type(instance)]
+    if instance._state.adding or (update_fields is not None and field_name not in update_fields):
+        return None
+    field_file = getattr(instance, field_name)
+    if field_file and field_file._committed:
+        return None
+    previous = (
+        type(instance).objects.filter(pk=instance.pk)
+        .values_list(field_name, flat=True).first()
+    )
+    return previous or None
+
+
+def update_renditions(instance):
+    """Render the instance's current image and record the widths made."""
+    field_name, widths_field = IMAGE_FIELDS[type(instance)]
+    field_file = getattr(instance, field_name)
+    widths = []
+    if field_file:
+        try:
+            widths = render(field_file.storage, field_file.name)
+        except (OSError, ValueError):
+            # The original is still served; rebuild_renditions can retry.
+            logger.exception("Could not render %s", field_file.name)
+    save_widths(type(instance), {instance.pk: widths})
+    setattr(instance, widths_field, widths)
+
+
+def save_widths(model, widths_by_pk):
+    """
+    Store rendition widths ({pk: widths}) and retire cached copies of those
+    rows. updated_at moves too, since the API's srcset fields change.
+    """
+    _, widths_field = IMAGE_FIELDS[model]
+    now = timezone.now()
+    model.objects.bulk_update(
+        [
+            model(pk=pk, updated_at=now, **{widths_field: widths})
+            for pk, widths in widths_by_pk.items()
+        ],
+        [widths_field, "updated_at"], batch_size=500,
+    )
+    kind, object_cache = CACHES[model]
+    for pk in widths_by_pk:
+        object_cache.invalidate(pk)
+        bump_card_version(kind, pk)
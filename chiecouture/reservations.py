@@ -0,0 +1,136 @@
+import operator
+from collections import Counter
+from datetime import timedelta
+from functools import reduce
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Min, PositiveIntegerField, Q, When
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .models import Product, StockReservation
+from .object_cache import product_cache
+
+# Stock accounting. Product.stock is what is on the shelf and
+# Product.reserved_stock what unexpired StockReservations hold of it, so
+# stock - reserved_stock is available to everyone else. Both counters only
+# change through conditional UPDATEs, which lock each product row for the
+# length of one statement; reading availability never takes a lock.
+
+DEFAULT_BATCH_SIZE = 500
+
+
+class InsufficientStock(Exception):
+    def __init__(self, products):
+        self.products = products
+        names = ", ".join(product.name for product in products)
+        super().__init__(f"Not enough stock for: {names}")
+
+
+def _held_by(user):
+    holds = list(StockReservation.objects.select_for_update().filter(user=user))
+    held = Counter()
+    for hold in holds:
+        held[hold.product_id] += hold.quantity
+    return holds, held
+
+
+def _case(expressions):
+    return Case(
+        *[When(pk=pk, then=expression) for pk, expression in expressions.items()],
+        output_field=PositiveIntegerField(),
+    )
+
+
+def _apply(conditions, **counters):
+    """
+    Run one UPDATE of `counters` ({field: {product id: expression}}) over the
+    products in `conditions` ({product id: Q}), which must all still hold.
+    Raises InsufficientStock naming the products that fell short.
+    """
+    if not conditions:
+        return
+    enough = reduce(operator.or_, [Q(pk=pk) & q for pk, q in conditions.items()])
+    values = {field: _case(expressions) for field, expressions in counters.items()}
+    updated = Product.objects.filter(enough).update(updated_at=Now(), **values)
+    if updated != len(conditions):
+        short = Product.objects.filter(pk__in=conditions).exclude(enough).order_by("id")
+        raise InsufficientStock(list(short))
+    for pk in conditions:
+        product_cache.invalidate(pk)
+
+
+def hold_stock(user, quantities):
+    """
+    Reserve `quantities` ({product id: quantity}) for `user` for
+    RESERVATION_TTL seconds, replacing the user's earlier holds. Either every
+    product is held or InsufficientStock is raised and nothing changes.
+    Returns the expiry time.
+    """
+    expires_at = timezone.now() + timedelta(seconds=getattr(settings, "RESERVATION_TTL", 600))
+    with transaction.atomic():
+        holds, held = _held_by(user)
+        deltas = {
+            pk: quantities.get(pk, 0) - held[pk]
+            for pk in set(quantities) | set(held)
+            if quantities.get(pk, 0) != held[pk]
+        }
+        _apply(
+            {pk: Q(stock__gte=F("reserved_stock") + delta) for pk, delta in deltas.items()},
+            reserved_stock={pk: F("reserved_stock") + delta for pk, delta in deltas.items()},
+        )
+        StockReservation.objects.filter(pk__in=[hold.pk for hold in holds]).delete()
+        StockReservation.objects.bulk_create([
+            StockReservation(product_id=pk, user=user, quantity=quantity, expires_at=expires_at)
+            for pk, quantity in quantities.items()
+        ])
+    return expires_at
+
+
+def held_until(user):
+    """When the earliest of `user`'s unexpired holds runs out, or None."""
+    return (
+        StockReservation.objects.filter(user=user, expires_at__gt=timezone.now())
+        .aggregate(until=Min("expires_at"))["until"]
+    )
+
+
+def take_stock(user, quantities):
+    """
+    Remove `quantities` ({product id: quantity}) from stock for an order by
+    `user`, using up (and releasing) the user's holds. Must run inside the
+    order's transaction. Raises InsufficientStock if a product cannot cover
+    the quantity from the user's hold plus what is still available.
+    """
+    holds, held = _held_by(user)
+    products = set(quantities) | set(held)
+    _apply(
+        {
+            pk: Q(stock__gte=F("reserved_stock") - held[pk] + quantities.get(pk, 0))
+            for pk in products
+        },
+        stock={pk: F("stock") - quantities.get(pk, 0) for pk in products},
+        reserved_stock={pk: F("reserved_stock") - held[pk] for pk in products},
+    )
+    if holds:
+        StockReservation.objects.filter(pk__in=[hold.pk for hold in holds]).delete()
+
+
+def release_expired(batch_size=DEFAULT_BATCH_SIZE):
+    """Release one batch of expired holds; return how many were released."""
+    with transaction.atomic():
+        holds = list(
+            StockReservation.objects.select_for_update(skip_locked=True)
+            .filter(expires_at__lte=timezone.now())
+            .order_by("expires_at")[:batch_size]
+        )
+        released = Counter()
+        for hold in holds:
+            released[hold.product_id] += hold.quantity
+        _apply(
+            {pk: Q() for pk in released},
+            reserved_stock={pk: F("reserved_stock") - count for pk, count in released.items()},
+        )
+        StockReservation.objects.filter(pk__in=[hold.pk for hold in holds]).delete()
+    return len(holds)
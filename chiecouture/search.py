@@ -0,0 +1,119 @@
+import operator
+import re
+from functools import reduce
+
+from django.db import connection
+from django.db.models import Case, ExpressionWrapper, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from .models import Product, ProductSearchDocument
+
+FTS_TABLE = "chiecouture_productsearch_fts"
+DOCUMENT_TABLE = ProductSearchDocument._meta.db_table
+PRODUCT_TABLE = Product._meta.db_table
+
+# Keyset ordering for ranked results: best match first, ties broken by id.
+RANK_ORDERING = ("-search_rank", "id")
+MAX_TERMS = 10
+BATCH_SIZE = 1000
+
+_TERM_RE = re.compile(r"\w+")
+_fts5_available = {}
+
+
+def search_terms(query):
+    """Split a free-text query into at most MAX_TERMS lowercase word tokens."""
+    return _TERM_RE.findall(query.lower())[:MAX_TERMS]
+
+
+def build_document(product, store_name=None):
+    """Text indexed for a product: its name, its store's name and its description."""
+    return "\n".join([product.name, store_name or product.store.name, product.description])
+
+
+def _upsert(documents):
+    # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target and rejects one.
+    target = {}
+    if connection.features.supports_update_conflicts_with_target:
+        target["unique_fields"] = ["product"]
+    ProductSearchDocument.objects.bulk_create(
+        documents, update_conflicts=True, update_fields=["document"], **target
+    )
+
+
+def index_product(product):
+    """Insert or refresh the search document of one product."""
+    _upsert([ProductSearchDocument(product=product, document=build_document(product))])
+
+
+def index_products(queryset):
+    """(Re)index every product in `queryset` in batches; return how many were indexed."""
+    indexed = 0
+    batch = []
+    for product in queryset.select_related("store").order_by("id").iterator(chunk_size=BATCH_SIZE):
+        batch.append(ProductSearchDocument(product=product, document=build_document(product)))
+        if len(batch) >= BATCH_SIZE:
+            _upsert(batch)
+            indexed += len(batch)
+            batch = []
+    if batch:
+        _upsert(batch)
+        indexed += len(batch)
+    return indexed
+
+
+def _has_fts5():
+    key = (connection.alias, connection.settings_dict["NAME"])
+    if key not in _fts5_available:
+        _fts5_available[key] = FTS_TABLE in connection.introspection.table_names()
+    return _fts5_available[key]
+
+
+def search_products(query, queryset=None):
+    """
+    Return `queryset` (all products by default) narrowed to products matching
+    `query` and annotated with a `search_rank` where higher is more relevant.
+
+    MySQL uses the FULLTEXT index on the search document table, SQLite its FTS5
+    table; any other backend falls back to a LIKE scan scored by matched terms.
+    """
+    if queryset is None:
+        queryset = Product.objects.all()
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    if connection.vendor == "mysql":
+        against = " ".join(terms)
+        matches = RawSQL(
+            f"SELECT product_id FROM {DOCUMENT_TABLE} "
+            "WHERE MATCH(document) AGAINST (%s IN NATURAL LANGUAGE MODE)",
+            (against,),
+        )
+        rank = RawSQL(
+            f"SELECT MATCH(document) AGAINST (%s IN NATURAL LANGUAGE MODE) "
+            f"FROM {DOCUMENT_TABLE} WHERE product_id = {PRODUCT_TABLE}.id",
+            (against,),
+            output_field=FloatField(),
+        )
+    elif connection.vendor == "sqlite" and _has_fts5():
+        expression = " OR ".join(f'"{term}"*' for term in terms)
+        matches = RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (expression,))
+        # bm25() is lower for better matches, so negate it to rank descending.
+        rank = RawSQL(
+            f"SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = {PRODUCT_TABLE}.id",
+            (expression,),
+            output_field=FloatField(),
+        )
+    else:
+        conditions = [Q(search_document__document__icontains=term) for term in terms]
+        rank = reduce(
+            operator.add,
+            [Case(When(c, then=Value(1.0)), default=Value(0.0)) for c in conditions],
+        )
+        return queryset.filter(reduce(operator.or_, conditions)).annotate(
+            search_rank=ExpressionWrapper(rank, output_field=FloatField())
+        )
+
+    return queryset.filter(id__in=matches).annotate(search_rank=rank)
@@ -1,11 +1,125 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Store, Product, Review
+from .models import Store, Product, Review, Order, OrderItem
+from .renditions import IMAGE_FIELDS, formats, srcset
 
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
+def parse_field_paths(value):
+    """
+    Turn "a,b.c,b.d" into {"a": {}, "b": {"c": {}, "d": {}}}.
+    Used for both the ?fields= and ?expand= query parameters.
+    """
+    tree = {}
+    for path in (value or "").split(","):
+        node = tree
+        for part in path.strip().split("."):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+class ExpandableFieldsMixin:
+    """
+    Sparse fieldsets for ModelSerializers.
+
+    By default related objects are rendered as primary keys (or left out for
+    reverse relations). ?expand=name swaps in the nested serializer named in
+    Meta.expandable_fields and dotted paths expand further down
+    (?expand=products.reviews). ?fields=id,name limits the output, again with
+    dotted paths for nested objects. The query parameters are only read by the
+    top-level serializer; nested ones receive their part of each tree.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if fields is None and expand is None and request is not None:
+            fields = parse_field_paths(request.query_params.get("fields"))
+            expand = parse_field_paths(request.query_params.get("expand"))
+        fields = fields or {}
+
+        for name, child_expand in (expand or {}).items():
+            if name not in self.get_expandable_fields():
+                continue
+            serializer_class, options = self.get_expandable_field(name)
+            self.fields[name] = serializer_class(
+                read_only=True, expand=child_expand, fields=fields.get(name), **options
+            )
+
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def get_expandable_fields(cls):
+        return getattr(cls.Meta, "expandable_fields", {})
+
+    @classmethod
+    def get_expandable_field(cls, name):
+        """Return (serializer class, kwargs) for an expandable field."""
+        serializer_class, options = cls.get_expandable_fields()[name]
+        if isinstance(serializer_class, str):
+            serializer_class = globals()[serializer_class]
+        return serializer_class, options
+
+
+def expansion_plan(serializer_class, expand, prefix=""):
+    """
+    Return (select_related, prefetch_related) lookups covering every relation
+    `expand` asks `serializer_class` to nest. Forward relations reached only
+    through other forward relations are joined; everything else is prefetched.
+    """
+    select, prefetch = [], []
+
+    def walk(serializer_class, expand, prefix, joined):
+        for name, child in expand.items():
+            if name not in serializer_class.get_expandable_fields():
+                continue
+            child_class, options = serializer_class.get_expandable_field(name)
+            path = prefix + name
+            single = not options.get("many")
+            (select if joined and single else prefetch).append(path)
+            walk(child_class, child, path + "__", joined and single)
+
+    walk(serializer_class, expand, prefix, True)
+    return select, prefetch
+
+
+def expand_queryset(queryset, serializer_class, request):
+    """Apply the select/prefetch plan for the request's ?expand= to `queryset`."""
+    expand = parse_field_paths(request.query_params.get("expand")) if request else {}
+    select, prefetch = expansion_plan(serializer_class, expand)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+class SrcsetField(serializers.Field):
+    """
+    The srcset of each rendition format of the model's image (see renditions.py),
+    e.g. {"webp": "<url> 160w, <url> 320w", "jpeg": ...}; null without renditions.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        field_name, widths_field = IMAGE_FIELDS[type(instance)]
+        field_file, widths = getattr(instance, field_name), getattr(instance, widths_field)
+        if not field_file or not widths:
+            return None
+        request = self.context.get("request")
+        build_url = request.build_absolute_uri if request else None
+        return {fmt: srcset(field_file, widths, fmt, build_url) for fmt in formats(field_file.name)}
+
+
+class UserSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     """Basic user representation for nested read-only display."""
 
     class Meta:
@@ -13,20 +127,24 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ("id", "username", "email", "role")
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     """Serializer for reviews. 'verified' is read-only and set by the view."""
-    user = UserSerializer(read_only=True)
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
         model = Review
         fields = ("id", "rating", "comment", "verified", "created_at", "user")
         read_only_fields = ("verified", "created_at", "user")
+        expandable_fields = {"user": (UserSerializer, {})}
 
 
-class ProductSerializer(serializers.ModelSerializer):
-    """Product representation; include nested read-only reviews."""
-    reviews = ReviewSerializer(many=True, read_only=True)
+class ProductSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    """Product summary; ?expand=store,reviews nests the store and reviews."""
     store = serializers.PrimaryKeyRelatedField(read_only=True)
+    rating_average = serializers.FloatField(read_only=True)
+    available_stock = serializers.IntegerField(read_only=True)
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+    image_srcset = SrcsetField()
 
     class Meta:
         model = Product
@@ -37,16 +155,47 @@ class ProductSerializer(serializers.ModelSerializer):
             "description",
             "price",
             "stock",
+            "available_stock",
             "image",
-            "reviews",
+            "image_srcset",
+            "review_count",
+            "rating_average",
+            "rating_histogram",
         )
+        read_only_fields = ("review_count",)
+        expandable_fields = {
+            "store": ("StoreSerializer", {}),
+            "reviews": (ReviewSerializer, {"many": True}),
+        }
 
 
-class StoreSerializer(serializers.ModelSerializer):
-    """Store representation; include nested read-only products and owner info."""
-    owner = UserSerializer(read_only=True)
-    products = ProductSerializer(many=True, read_only=True)
+class StoreSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    """Store summary; ?expand=owner,products nests the owner and products."""
+    owner = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
         model = Store
-        fields = ("id", "name", "owner", "description", "products")
+        fields = ("id", "name", "owner", "description")
+        expandable_fields = {
+            "owner": (UserSerializer, {}),
+            "products": (ProductSerializer, {"many": True}),
+        }
+
+
+class OrderItemSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    """Order line as recorded at checkout; never reads the live product."""
+    product = serializers.PrimaryKeyRelatedField(read_only=True)
+    store = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    class Meta:
+        model = OrderItem
+        fields = ("id", "product", "product_name", "store", "quantity", "price")
+
+
+class OrderSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    """A buyer's order with its lines."""
+    items = OrderItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ("id", "created_at", "total", "items")
@@ -1,28 +1,228 @@
-from django.db.models.signals import post_save
+from functools import partial
+
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from .models import Store, Product
-from .twitter_client import tweet_new_store, tweet_new_product
+from .announcements import announce_product, announce_store
+from .carts import flush_cart
+from .fragments import bump_card_version
+from .models import Store, Product, Review
+from .object_cache import product_cache, store_cache
+from .pricing import bump_prices_version
+from .renditions import IMAGE_FIELDS, image_changed, replaced_image, update_renditions
+from .search import index_product, index_products
+
+# Fields whose change requires a product's search document to be rebuilt.
+PRODUCT_SEARCH_FIELDS = {"name", "description", "store", "store_id"}
+
+# Product fields copied into cached cart pricings (see pricing.CartLine).
+PRODUCT_PRICING_FIELDS = ("price", "name", "store_id")
 
 
 @receiver(post_save, sender=Store)
 def announce_new_store(sender, instance, created, **kwargs):
     """
-    Post a tweet when a new store is created.
+    Queue an announcement of a new store for dispatch_announcements.
     """
-    if created:  # only tweet for new stores
-        try:
-            tweet_new_store(instance.name)
-        except Exception as e:
-            print(f"Error tweeting about new store: {e}")
+    if created:
+        announce_store(instance)
 
 
 @receiver(post_save, sender=Product)
 def announce_new_product(sender, instance, created, **kwargs):
     """
-    Post a tweet when a new product is created.
+    Queue an announcement of a new product for dispatch_announcements.
+    """
+    if created:
+        announce_product(instance)
+
+
+@receiver(post_save, sender=Review)
+def count_new_review(sender, instance, created, **kwargs):
+    """
+    Add a new review to its product's rating aggregates.
+    """
+    if created:
+        Product.adjust_rating_aggregates(instance.product_id, instance.rating, 1)
+
+
+@receiver(post_delete, sender=Review)
+def uncount_deleted_review(sender, instance, **kwargs):
+    """
+    Remove a deleted review from its product's rating aggregates.
+    """
+    Product.adjust_rating_aggregates(instance.product_id, instance.rating, -1)
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, update_fields=None, **kwargs):
+    """
+    Refresh the product's full-text search document.
+    """
+    if update_fields is not None and not PRODUCT_SEARCH_FIELDS & set(update_fields):
+        return
+    index_product(instance)
+
+
+@receiver(post_save, sender=Store)
+def reindex_store_products(sender, instance, created, **kwargs):
+    """
+    A store's name is part of its products' search documents.
+    """
+    if not created:
+        index_products(instance.products.all())
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cards(sender, instance, **kwargs):
+    """
+    Drop cached product card fragments.
+    """
+    bump_card_version("product", instance.pk)
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def invalidate_store_cards(sender, instance, **kwargs):
+    """
+    Drop cached store card fragments.
+    """
+    bump_card_version("store", instance.pk)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_reviewed_product_cards(sender, instance, **kwargs):
+    """
+    Product cards show the rating, which changes with every review.
+    """
+    bump_card_version("product", instance.product_id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_cached_product(sender, instance, **kwargs):
+    """
+    Retire the product's row in the object cache.
+    """
+    product_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def invalidate_cached_store(sender, instance, **kwargs):
+    """
+    Retire the store's row in the object cache.
+    """
+    store_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_cached_reviewed_product(sender, instance, **kwargs):
+    """
+    Rating aggregates are written with update(), which sends no product signal.
+    """
+    product_cache.invalidate(instance.product_id)
+
+
+@receiver(user_logged_in)
+def merge_session_cart(sender, request, user, **kwargs):
+    """
+    Move anything added to the cart before logging in into the user's cart.
+    """
+    if request is not None:
+        flush_cart(request, user)
+
+
+@receiver(user_logged_out)
+def save_session_cart(sender, request, user, **kwargs):
+    """
+    Logging out clears the session, so write its pending additions first.
+    """
+    if request is not None and user is not None:
+        flush_cart(request, user)
+
+
+@receiver(pre_save, sender=Product)
+def note_pricing_change(sender, instance, update_fields=None, **kwargs):
+    """
+    Cached cart totals only go stale when a saved product's price, name or
+    store changes; new products are in no cart yet.
+    """
+    instance._pricing_changed = False
+    if instance._state.adding:
+        return
+    fields = PRODUCT_PRICING_FIELDS
+    if update_fields is not None:
+        fields = [
+            name for name in fields
+            if name in update_fields or name.removesuffix("_id") in update_fields
+        ]
+        if not fields:
+            return
+    previous = Product.objects.filter(pk=instance.pk).values_list(*fields).first()
+    current = tuple(
+        Product._meta.get_field(name).to_python(getattr(instance, name)) for name in fields
+    )
+    instance._pricing_changed = previous is not None and previous != current
+
+
+@receiver(post_save, sender=Product)
+def invalidate_cart_pricing(sender, instance, **kwargs):
+    """
+    Cached cart lines carry product prices, names and stores.
+    """
+    if getattr(instance, "_pricing_changed", False):
+        instance._pricing_changed = False
+        bump_prices_version()
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_cart_pricing_on_delete(sender, instance, **kwargs):
+    """
+    Deleting a product empties it from carts.
+    """
+    bump_prices_version()
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=Store)
+def note_changed_image(sender, instance, update_fields=None, **kwargs):
+    """
+    Renditions are made after the save, once the upload has its final name,
+    and the image it replaces is released then too.
+    """
+    instance._image_changed = image_changed(instance)
+    instance._replaced_image = replaced_image(instance, update_fields)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Store)
+def render_changed_image(sender, instance, **kwargs):
+    """
+    Make the renditions of a newly uploaded image (or drop a cleared one's)
+    once the save commits, so the transaction is not held open for the
+    resizing and a rolled back save leaves no renditions behind.
+    """
+    if getattr(instance, "_image_changed", False):
+        instance._image_changed = False
+        transaction.on_commit(partial(update_renditions, instance))
+    replaced = getattr(instance, "_replaced_image", None)
+    if replaced:
+        instance._replaced_image = None
+        getattr(instance, IMAGE_FIELDS[sender][0]).storage.delete(replaced)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Store)
+def release_deleted_image(sender, instance, **kwargs):
+    """
+    Release the image of a deleted product or store (storage.py keeps files
+    other rows still use).
     """
-    if created:  # only tweet for new products
-        try:
-            tweet_new_product(instance.store.name, instance.name)
-        except Exception as e:
-            print(f"Error tweeting about new product: {e}")
+    field_file = getattr(instance, IMAGE_FIELDS[sender][0])
+    if field_file:
+        field_file.storage.delete(field_file.name)
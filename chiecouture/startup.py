@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+from collections import namedtuple
+
+from django.conf import settings
+
+# Startup cost: every worker boot, manage.py command and test run pays for
+# django.setup() plus the URLconf (which imports every view). measure_startup()
+# times both in a fresh interpreter, optionally under `python -X importtime`,
+# and the startup_report command and StartupTests use it to keep integration
+# libraries (see integrations.py) off the import path.
+STARTUP_MODULES = ("chiecouture_project.urls",)
+# Wall-clock ceiling for measure_startup() in StartupTests, several times the
+# usual cost so that only a real regression fails it.
+STARTUP_BUDGET = 2.0
+# Third-party client libraries that must only be imported on first use.
+LAZY_MODULES = ("tweepy", "oauthlib", "requests_oauthlib", "PIL")
+
+ImportTime = namedtuple("ImportTime", "module self_us cumulative_us depth")
+StartupReport = namedtuple("StartupReport", "seconds imports modules")
+
+_SCRIPT = """
+import sys, time
+started = time.perf_counter()
+import django
+django.setup()
+for name in sys.argv[1:]:
+    __import__(name)
+print(time.perf_counter() - started)
+print(" ".join(sorted(sys.modules)))
+"""
+
+
+def parse_importtime(output):
+    """Parse the stderr of `python -X importtime` into ImportTimes, in import order."""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the header line
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append(ImportTime(name.strip(), int(fields[0]), int(fields[1]), depth))
+    return imports
+
+
+def measure_startup(modules=STARTUP_MODULES, importtime=False):
+    """
+    Run django.setup() and import `modules` in a new interpreter with the
+    current settings. Returns a StartupReport of the wall-clock seconds, the
+    ImportTimes when `importtime` is set (else an empty list) and the names of
+    all modules loaded.
+    """
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE,
+        PYTHONPATH=os.pathsep.join(sys.path),
+    )
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", _SCRIPT, *modules]
+    result = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+    seconds, loaded = result.stdout.splitlines()[-2:]
+    imports = parse_importtime(result.stderr) if importtime else []
+    return StartupReport(float(seconds), imports, set(loaded.split()))
@@ -0,0 +1,114 @@
+import hashlib
+import posixpath
+import re
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+from django.db import transaction
+
+from .models import StoredFile
+
+# Media files are named by the SHA-256 of their content ("products/<hash>.jpg"),
+# so a name always means the same bytes and can be cached forever (see
+# views.serve_media), and re-uploading an image stores nothing new. StoredFile
+# counts the saves sharing each file; deleting one only removes the file (and
+# the renditions derived from it) when no other save refers to it. A new file is
+# written when the saving transaction commits, so a rollback leaves none behind.
+CONTENT_ADDRESSED = re.compile(r"(^|/)[0-9a-f]{64}(\.[^/]*)?$")
+
+
+def is_content_addressed(name):
+    """True for names given by ContentAddressedStorage, and files derived from them."""
+    return bool(CONTENT_ADDRESSED.search(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage that dedupes files by content and reference-counts them."""
+
+    def content_name(self, name, content):
+        """`name` with its file name replaced by the content's hash (extension kept)."""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name.replace("\\", "/"))
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest.hexdigest() + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        validate_file_name(name, allow_relative_path=True)
+        if transaction.get_connection().in_atomic_block and not self.exists(name):
+            # The caller may close `content` before its transaction commits.
+            content = self._spool(content)
+        with transaction.atomic():
+            StoredFile.objects.get_or_create(name=name)
+            stored = StoredFile.objects.select_for_update().get(name=name)
+            stored.references += 1
+            stored.save(update_fields=["references"])
+            transaction.on_commit(lambda: self._write(name, content))
+        return name
+
+    @staticmethod
+    def _spool(content):
+        spooled = SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        for chunk in content.chunks():
+            spooled.write(chunk)
+        spooled.seek(0)
+        return File(spooled, content.name)
+
+    def _write(self, name, content):
+        if self.exists(name):
+            return
+        saved = self._save(name, content)
+        if saved != name:
+            # Another process wrote the same content first; keep one copy.
+            super().delete(saved)
+
+    def save_derived(self, name, content):
+        """
+        Write a file derived from a stored one (a rendition) under exactly
+        `name`, unless it exists: derived names are built from the source's
+        content hash and the settings that made them, so it holds these bytes.
+        It is removed with its source.
+        """
+        if not self.exists(name):
+            self._write(name, content)
+        return name
+
+    def delete(self, name):
+        """Drop one reference to `name`; the last one removes the file after commit."""
+        if not name:
+            return
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(name=name).first()
+            if stored is not None and stored.references > 1:
+                stored.references -= 1
+                stored.save(update_fields=["references"])
+                return
+            if stored is not None:
+                stored.delete()
+            transaction.on_commit(lambda: self._remove(name))
+
+    def _remove(self, name):
+        # A save of the same content may have come in since the delete.
+        if StoredFile.objects.filter(name=name).exists():
+            return
+        directory, filename = posixpath.split(name)
+        derived = re.compile(
+            re.escape(posixpath.splitext(filename)[0]) + r"(\.[0-9a-f]+)?\.\d+w\.\w+$"
+        )
+        try:
+            files = self.listdir(directory)[1]
+        except FileNotFoundError:
+            return
+        for other in files:
+            if other == filename or derived.match(other):
+                super().delete(posixpath.join(directory, other))
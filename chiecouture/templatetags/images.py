@@ -0,0 +1,28 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from ..renditions import WEBP, fallback_format, srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(field_file, widths, sizes="100vw", **attrs):
+    """
+    Render an uploaded image from its renditions (see renditions.py): a
+    <picture> offering the WebP and fallback srcsets, with the original as the
+    <img> src for browsers that use neither. Extra keyword arguments become
+    <img> attributes:
+
+        {% responsive_image product.image product.image_widths sizes="33vw" alt=product.name %}
+    """
+    attributes = format_html_join(" ", '{}="{}"', attrs.items())
+    if not widths:
+        return format_html('<img src="{}" {}>', field_file.url, attributes)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" {}></picture>',
+        srcset(field_file, widths, WEBP), sizes,
+        field_file.url, srcset(field_file, widths, fallback_format(field_file.name)), sizes,
+        attributes,
+    )
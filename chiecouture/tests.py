@@ -1,10 +1,56 @@
-from django.test import TestCase, Client
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from smtplib import SMTPException
+from unittest import mock
+
+from PIL import Image
+
+from django.core import mail
+from django.core.cache import cache
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
 from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
 from django.utils import timezone
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.core.files.uploadedfile import SimpleUploadedFile
 
-from .models import Store, Product, Cart, CartItem, Review, Order, PasswordResetToken
+from .models import (
+    Announcement, Store, Product, Cart, CartItem, Review, Order, OrderItem, OutboxEmail,
+    PasswordResetToken, Purchase, StockReservation, StoredFile,
+)
+from . import integrations
+from .announcements import MemoryTransport, RateLimited, announce_product, dispatch_batch
+from .carts import merge_into_cart, update_quantities
+from .checkout import CheckoutError, place_order
+from .idempotency import request_scope
+from .middleware import RequestMetrics
+from .object_cache import product_cache, store_cache
+from .outbox import deliver_batch, queue_email
+from .pricing import price_cart
+from .renditions import RENDITION_VERSION, render, rendition_name
+from .reservations import InsufficientStock, hold_stock, release_expired
+from .search import index_products, search_products
+from .startup import LAZY_MODULES, STARTUP_BUDGET, measure_startup, parse_importtime
+from .views import serve_media
 
 User = get_user_model()
 
@@ -56,6 +102,31 @@ class ReviewTests(TestCase):
         review = Review.objects.create(product=self.product, user=self.buyer, rating=5, comment="Great!")
         self.assertEqual(review.rating, 5)
 
+    def test_rating_aggregates_follow_reviews(self):
+        Review.objects.create(product=self.product, user=self.buyer, rating=5, comment="Great!")
+        low = Review.objects.create(product=self.product, user=self.buyer, rating=2, comment="Meh")
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.review_count, 2)
+        self.assertEqual(self.product.rating_average, 3.5)
+        self.assertEqual(self.product.rating_histogram, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1})
+
+        low.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.review_count, 1)
+        self.assertEqual(self.product.rating_average, 5)
+        self.assertEqual(self.product.rating_2_count, 0)
+
+    def test_rebuild_rating_aggregates_command(self):
+        Review.objects.create(product=self.product, user=self.buyer, rating=4, comment="Good")
+        Product.objects.filter(pk=self.product.pk).update(
+            review_count=0, rating_sum=0, rating_4_count=0
+        )
+        call_command("rebuild_rating_aggregates", stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.review_count, 1)
+        self.assertEqual(self.product.rating_sum, 4)
+        self.assertEqual(self.product.rating_4_count, 1)
+
 
 # --------------------------
 # Password Reset Tests
@@ -70,6 +141,72 @@ class PasswordResetTests(TestCase):
         token.created_at = timezone.now() - timezone.timedelta(days=2)
         self.assertFalse(token.is_valid())
 
+    def reset_link(self):
+        self.client.post(reverse("request_password_reset"), {"email": "a@b.com"})
+        deliver_batch()
+        return mail.outbox[-1].body.split("http://testserver")[1]
+
+    def test_signed_link_writes_nothing_and_works_once(self):
+        link = self.reset_link()
+        self.assertFalse(PasswordResetToken.objects.exists())
+        self.assertEqual(self.client.get(link).status_code, 200)
+        passwords = {"password": "N3w-password", "confirm_password": "N3w-password"}
+        self.assertRedirects(self.client.post(link, passwords), reverse("login"))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("N3w-password"))
+        # Changing the password retires the token.
+        self.assertRedirects(self.client.get(link), reverse("home"))
+
+    def signed_link(self, age):
+        class Generator(PasswordResetTokenGenerator):
+            def _now(self):
+                return super()._now() - age
+
+        uidb64 = urlsafe_base64_encode(force_bytes(self.user.pk))
+        return reverse("reset_password_signed", args=[uidb64, Generator().make_token(self.user)])
+
+    def test_signed_link_lasts_reset_timeout(self):
+        self.assertEqual(self.client.get(self.signed_link(timedelta(minutes=30))).status_code, 200)
+        expired = self.signed_link(timedelta(seconds=settings.PASSWORD_RESET_TIMEOUT + 60))
+        self.assertRedirects(self.client.get(expired), reverse("home"))
+        self.assertEqual(
+            PasswordResetToken.LIFETIME, timedelta(seconds=settings.PASSWORD_RESET_TIMEOUT)
+        )
+
+    def test_tampered_signed_link_is_rejected(self):
+        link = self.reset_link()
+        self.assertRedirects(self.client.get(link[:-2] + "x/"), reverse("home"))
+
+    def test_signed_reset_validates_password(self):
+        link = self.reset_link()
+        response = self.client.post(
+            link, {"password": "12345678", "confirm_password": "12345678"}, follow=True
+        )
+        self.assertContains(response, "This password is entirely numeric.")
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("pass"))
+
+    @override_settings(PASSWORD_RESET_TOKEN_MODE="table")
+    def test_table_mode_stores_token(self):
+        link = self.reset_link()
+        token = PasswordResetToken.objects.get()
+        self.assertEqual(link, reverse("reset_password", args=[token.token]))
+        passwords = {"password": "N3w-password", "confirm_password": "N3w-password"}
+        self.assertRedirects(self.client.post(link, passwords), reverse("login"))
+        self.assertFalse(PasswordResetToken.objects.exists())
+
+    def test_purge_expired_tokens_in_batches(self):
+        for _ in range(5):
+            PasswordResetToken.objects.create(user=self.user)
+        expired = PasswordResetToken.objects.order_by("id")[:3]
+        PasswordResetToken.objects.filter(pk__in=[t.pk for t in expired]).update(
+            created_at=timezone.now() - PasswordResetToken.LIFETIME
+        )
+        out = StringIO()
+        call_command("purge_reset_tokens", batch_size=2, stdout=out)
+        self.assertIn("Deleted 3 expired reset tokens", out.getvalue())
+        self.assertEqual(PasswordResetToken.objects.count(), 2)
+
 
 # --------------------------
 # General View Tests
@@ -128,3 +265,1628 @@ class TwitterIntegrationTests(TestCase):
         )
         self.assertEqual(response.status_code, 302)
         self.assertTrue(Store.objects.filter(name="LiveStore").exists())
+
+
+# --------------------------
+# Pagination Tests
+# --------------------------
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Test Store", owner=self.vendor)
+        self.products = [
+            Product.objects.create(store=self.store, name=f"Item {i}", price=10, stock=1)
+            for i in range(5)
+        ]
+
+    def test_product_list_pages_follow_next_cursor(self):
+        response = self.client.get(reverse("product_list"), {"page_size": 2})
+        page = response.context["products"]
+        self.assertEqual([p.id for p in page], [p.id for p in self.products[:2]])
+        self.assertTrue(page.has_next)
+
+        seen = [p.id for p in page]
+        while page.has_next:
+            response = self.client.get(reverse("product_list") + "?" + page.next_query)
+            page = response.context["products"]
+            seen.extend(p.id for p in page)
+        self.assertEqual(seen, [p.id for p in self.products])
+
+    def test_page_size_is_capped(self):
+        url = reverse("store_detail", args=[self.store.id])
+        response = self.client.get(url, {"page_size": 10**6})
+        self.assertEqual(response.context["products"].page_size, 100)
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get(reverse("product_list"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_api_product_list_is_cursor_paginated(self):
+        response = self.client.get("/api/products/", {"page_size": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNotNone(response.data["next"])
+        response = self.client.get(response.data["next"])
+        self.assertEqual(
+            [p["id"] for p in response.data["results"]], [p.id for p in self.products[2:4]]
+        )
+
+
+# --------------------------
+# Search Tests
+# --------------------------
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Velvet House", owner=self.vendor)
+        self.dress = Product.objects.create(
+            store=self.store, name="Silk Dress", description="Evening dress in silk", price=90
+        )
+        self.scarf = Product.objects.create(
+            store=self.store, name="Wool Scarf", description="Goes well with a silk dress", price=20
+        )
+        self.hat = Product.objects.create(store=self.store, name="Straw Hat", price=15)
+
+    def test_results_are_ranked_by_relevance(self):
+        results = list(search_products("silk dress"))
+        self.assertEqual({p.id for p in results}, {self.dress.id, self.scarf.id})
+        ranked = sorted(results, key=lambda p: -p.search_rank)
+        self.assertEqual(ranked[0], self.dress)
+
+    def test_index_follows_product_and_store_saves(self):
+        self.hat.name = "Panama Hat"
+        self.hat.save()
+        self.assertEqual(list(search_products("panama")), [self.hat])
+
+        self.store.name = "Atelier Nord"
+        self.store.save()
+        self.assertEqual(search_products("atelier").count(), 3)
+
+    def test_index_without_upsert_conflict_target(self):
+        # MySQL upserts with ON DUPLICATE KEY UPDATE, which names no target.
+        features = connection.features
+        with mock.patch.object(features, "supports_update_conflicts_with_target", False):
+            boots = Product.objects.create(store=self.store, name="Riding Boots", price=120)
+        self.assertEqual(list(search_products("boots")), [boots])
+
+    def test_search_api_paginates_ranked_results(self):
+        response = self.client.get("/api/products/search/", {"q": "silk", "page_size": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["id"], self.dress.id)
+        response = self.client.get(response.data["next"])
+        self.assertEqual([p["id"] for p in response.data["results"]], [self.scarf.id])
+        self.assertIsNone(response.data["next"])
+
+    def test_search_api_requires_query(self):
+        response = self.client.get("/api/products/search/")
+        self.assertEqual(response.status_code, 400)
+
+    def test_product_list_search_box(self):
+        response = self.client.get(reverse("product_list"), {"q": "hat"})
+        self.assertEqual(list(response.context["products"]), [self.hat])
+        self.assertContains(response, 'value="hat"')
+
+
+# --------------------------
+# Facet Tests
+# --------------------------
+class ProductFacetTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.buyer = User.objects.create_user(username="buyer", password="pass", role="buyer")
+        vendor_a = User.objects.create_user(username="vendor_a", password="pass", role="vendor")
+        vendor_b = User.objects.create_user(username="vendor_b", password="pass", role="vendor")
+        self.store_a = Store.objects.create(name="Store A", owner=vendor_a)
+        self.store_b = Store.objects.create(name="Store B", owner=vendor_b)
+        self.cheap = Product.objects.create(store=self.store_a, name="Cheap Tee", price=10, stock=5)
+        self.sold_out = Product.objects.create(
+            store=self.store_a, name="Sold Out", price=30, stock=0
+        )
+        self.premium = Product.objects.create(
+            store=self.store_b, name="Premium Coat", price=300, stock=2
+        )
+        Review.objects.create(product=self.premium, user=self.buyer, rating=5, comment="Lovely")
+        Review.objects.create(product=self.cheap, user=self.buyer, rating=2, comment="Thin")
+
+    def results(self, **params):
+        response = self.client.get("/api/products/", params)
+        self.assertEqual(response.status_code, 200)
+        return response, [p["id"] for p in response.data["results"]]
+
+    def test_filters_combine(self):
+        _, ids = self.results(min_price=5, max_price=50)
+        self.assertEqual(ids, [self.cheap.id, self.sold_out.id])
+        _, ids = self.results(min_price=5, max_price=50, in_stock="true")
+        self.assertEqual(ids, [self.cheap.id])
+        _, ids = self.results(store=self.store_b.id)
+        self.assertEqual(ids, [self.premium.id])
+        _, ids = self.results(min_rating=4)
+        self.assertEqual(ids, [self.premium.id])
+
+    def test_facet_counts_ignore_their_own_selection(self):
+        response, _ = self.results(store=self.store_a.id)
+        facets = response.data["facets"]
+        self.assertEqual(
+            {s["id"]: s["count"] for s in facets["store"]}, {self.store_a.id: 2, self.store_b.id: 1}
+        )
+        self.assertEqual(facets["in_stock"], {"in_stock": 1, "out_of_stock": 1})
+        self.assertEqual(facets["min_rating"][0], {"value": 4, "count": 0})
+        self.assertEqual(facets["price"][0]["count"], 1)
+
+    def test_invalid_filters_are_rejected(self):
+        response = self.client.get("/api/products/", {"min_price": 50, "max_price": 10})
+        self.assertEqual(response.status_code, 400)
+
+    def test_product_list_page_filters(self):
+        response = self.client.get(reverse("product_list"), {"in_stock": "on", "max_price": 100})
+        self.assertEqual(list(response.context["products"]), [self.cheap])
+        self.assertEqual(response.context["facets"]["in_stock"]["out_of_stock"], 1)
+
+    def test_search_results_carry_facets(self):
+        response = self.client.get("/api/products/search/", {"q": "coat tee", "in_stock": "true"})
+        self.assertEqual(
+            {p["id"] for p in response.data["results"]}, {self.cheap.id, self.premium.id}
+        )
+        self.assertEqual(
+            {s["id"]: s["count"] for s in response.data["facets"]["store"]},
+            {self.store_a.id: 1, self.store_b.id: 1},
+        )
+
+
+# --------------------------
+# Sparse Fieldset Tests
+# --------------------------
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.buyer = User.objects.create_user(username="buyer", password="pass", role="buyer")
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Test Store", owner=self.vendor)
+        self.product = Product.objects.create(store=self.store, name="Shirt", price=50, stock=10)
+        Review.objects.create(product=self.product, user=self.buyer, rating=4, comment="Nice")
+
+    def test_stores_are_flat_by_default(self):
+        store = self.client.get("/api/stores/").data["results"][0]
+        self.assertEqual(store["owner"], self.vendor.id)
+        self.assertNotIn("products", store)
+
+    def test_expand_nests_and_fields_trims(self):
+        response = self.client.get(
+            "/api/stores/",
+            {
+                "expand": "owner,products.reviews.user",
+                "fields": "id,owner,products.name,products.reviews",
+            },
+        )
+        store = response.data["results"][0]
+        self.assertEqual(set(store), {"id", "owner", "products"})
+        self.assertEqual(store["owner"]["username"], "vendor")
+        self.assertEqual(set(store["products"][0]), {"name", "reviews"})
+        self.assertEqual(store["products"][0]["reviews"][0]["user"]["username"], "buyer")
+
+    def test_expanded_relations_are_prefetched(self):
+        for i in range(3):
+            Product.objects.create(store=self.store, name=f"Extra {i}", price=5)
+        url = f"/api/stores/{self.store.id}/products/"
+        # store lookup + products joined to their store + reviews + review users
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {"expand": "store,reviews.user"})
+        self.assertEqual(len(response.data["results"]), 4)
+        self.assertEqual(response.data["results"][0]["store"]["name"], "Test Store")
+
+
+# --------------------------
+# API Query Budget Tests
+# --------------------------
+class QueryBudgetMixin:
+    """
+    Every API endpoint must run a fixed number of queries however many rows it
+    renders. Subclasses build `rows` users, stores, products and reviews; the
+    budgets below are shared, so a query that scales with the data fails one size.
+    """
+    rows = 1
+
+    BUDGETS = [
+        # (name, url template, query params, queries)
+        ("store list", "/api/stores/", {}, 2),
+        ("store list expanded", "/api/stores/", {"expand": "owner,products.reviews.user"}, 4),
+        ("store detail", "/api/stores/{store}/", {"expand": "owner,products"}, 2),
+        ("store products", "/api/stores/{store}/products/", {"expand": "store,reviews.user"}, 4),
+        ("product list", "/api/products/", {}, 4),
+        ("product list expanded", "/api/products/", {"expand": "store.owner,reviews"}, 4),
+        ("product detail", "/api/products/{product}/", {"expand": "store,reviews.user"}, 3),
+        ("product search", "/api/products/search/", {"q": "item"}, 3),
+        ("product reviews", "/api/products/{product}/reviews/", {"expand": "user"}, 2),
+        ("vendor stores", "/api/vendors/{vendor}/stores/", {"expand": "owner,products"}, 2),
+        ("review list view", "/products/{product}/reviews/", {"expand": "user"}, 1),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        n = cls.rows
+        password = make_password("pass")
+        users = User.objects.bulk_create(
+            User(username=f"user{i}", password=password, role="vendor") for i in range(n)
+        )
+        stores = Store.objects.bulk_create(
+            Store(name=f"Store {i}", owner=user) for i, user in enumerate(users)
+        )
+        products = Product.objects.bulk_create(
+            Product(store=stores[0], name=f"Item {i}", price=10, stock=1) for i in range(n)
+        )
+        # Reviewers cycle through at most 100 users: SQLite rejects the very long
+        # IN lists Django builds when prefetching 1000 distinct review authors.
+        Review.objects.bulk_create(
+            Review(
+                product=products[0], store=stores[0], user=users[i % 100], rating=5,
+                comment="Good",
+            )
+            for i in range(n)
+        )
+        index_products(Product.objects.all())
+        cls.ids = {"store": stores[0].id, "product": products[0].id, "vendor": users[0].id}
+
+    def test_query_budgets(self):
+        for name, url, params, budget in self.BUDGETS:
+            with self.subTest(endpoint=name):
+                with self.assertNumQueries(budget):
+                    response = self.client.get(url.format(**self.ids), params)
+                self.assertEqual(response.status_code, 200)
+
+
+class QueryBudgetOneRowTests(QueryBudgetMixin, TestCase):
+    rows = 1
+
+
+class QueryBudgetTenRowTests(QueryBudgetMixin, TestCase):
+    rows = 10
+
+
+class QueryBudgetThousandRowTests(QueryBudgetMixin, TestCase):
+    rows = 1000
+
+
+# --------------------------
+# Request Metrics Tests
+# --------------------------
+@override_settings(REQUEST_METRICS_ENABLED=True, REQUEST_METRICS_LOG_SAMPLE_RATE=1.0)
+class RequestMetricsMiddlewareTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Test Store", owner=self.vendor)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse("store_detail", args=[self.store.id]))
+        timing = response["Server-Timing"]
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="2 queries, 0 duplicate"', timing)
+        for metric in ("tpl;dur=", "view;dur=", "total;dur="):
+            self.assertIn(metric, timing)
+
+    def test_sampled_log_line_counts_duplicates(self):
+        with self.assertLogs("chiecouture.metrics", level="INFO") as logs:
+            self.client.get("/api/stores/")
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line["view"], "store-list")
+        self.assertEqual(line["status"], 200)
+        self.assertEqual(line["queries"], 2)
+        self.assertEqual(line["duplicate_queries"], 0)
+
+    def test_repeated_queries_are_counted_as_duplicates(self):
+        metrics = RequestMetrics()
+        execute = lambda sql, params, many, context: None  # noqa: E731
+        for params in ((1,), (1,), (2,)):
+            metrics.record_query(execute, "SELECT %s", params, False, {})
+        self.assertEqual(metrics.queries, 3)
+        self.assertEqual(metrics.duplicates, 1)
+
+    def test_view_time_excludes_sql_and_template_time(self):
+        metrics = RequestMetrics()
+        slow = lambda sql, params, many, context: time.sleep(0.05)  # noqa: E731
+        metrics.start_view()
+        metrics.record_query(slow, "SELECT 1", (), False, {})
+        # A query run while rendering is template time, not counted twice.
+        metrics.rendering += 1
+        started = time.perf_counter()
+        metrics.record_query(slow, "SELECT 2", (), False, {})
+        metrics.rendering -= 1
+        metrics.template_seconds += time.perf_counter() - started
+        metrics.stop_view()
+        self.assertGreaterEqual(metrics.sql_seconds, 0.1)
+        self.assertLess(metrics.view_seconds, 0.02)
+
+    @override_settings(REQUEST_METRICS_ENABLED=False)
+    def test_disabled_middleware_adds_nothing(self):
+        response = Client().get(reverse("home"))
+        self.assertNotIn("Server-Timing", response)
+
+
+# --------------------------
+# Fragment Cache Tests
+# --------------------------
+class CardFragmentCacheTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Test Store", owner=self.vendor)
+        self.product = Product.objects.create(store=self.store, name="Shirt", price=50, stock=10)
+
+    def test_product_card_is_served_from_cache(self):
+        self.assertContains(self.client.get(reverse("product_list")), "Shirt")
+        # A queryset update sends no signal, so the cached card is still used.
+        Product.objects.filter(pk=self.product.pk).update(name="Renamed")
+        self.assertContains(self.client.get(reverse("product_list")), "Shirt")
+
+    def test_saving_a_product_invalidates_its_cards(self):
+        self.client.get(reverse("product_list"))
+        self.client.get(reverse("store_detail", args=[self.store.id]))
+        self.product.name = "Blouse"
+        self.product.save()
+        self.assertContains(self.client.get(reverse("product_list")), "Blouse")
+        self.assertContains(
+            self.client.get(reverse("store_detail", args=[self.store.id])), "Blouse"
+        )
+
+    def test_new_review_refreshes_product_card_rating(self):
+        self.client.get(reverse("product_list"))
+        Review.objects.create(product=self.product, user=self.vendor, rating=4, comment="Ok")
+        self.assertContains(self.client.get(reverse("product_list")), "Rating: 4")
+
+    def test_saving_a_store_invalidates_its_cards(self):
+        self.client.get(reverse("home"))
+        self.client.get(reverse("store_list"))
+        self.store.name = "New Name"
+        self.store.save()
+        self.assertContains(self.client.get(reverse("home")), "New Name")
+        self.assertContains(self.client.get(reverse("store_list")), "New Name")
+
+    def test_add_to_cart_form_is_not_cached(self):
+        first = self.client.get(reverse("product_list"))
+        other = Client().get(reverse("product_list"))
+        self.assertNotEqual(first.context["csrf_token"], other.context["csrf_token"])
+        self.assertContains(other, str(other.context["csrf_token"]))
+
+
+# --------------------------
+# Conditional GET Tests
+# --------------------------
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.buyer = User.objects.create_user(username="buyer", password="pass", role="buyer")
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Test Store", owner=self.vendor)
+        self.product = Product.objects.create(store=self.store, name="Shirt", price=50, stock=10)
+        Review.objects.create(product=self.product, user=self.buyer, rating=4, comment="Nice")
+
+    def assertRevalidates(self, url):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first["ETag"].startswith('W/"'))
+        self.assertIn("Last-Modified", first)
+        with self.assertNumQueries(1):
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        return first["ETag"]
+
+    def test_unchanged_resources_answer_304(self):
+        for url in (
+            "/api/products/",
+            f"/api/products/{self.product.id}/",
+            "/api/stores/",
+            f"/api/stores/{self.store.id}/",
+            f"/api/stores/{self.store.id}/products/",
+            f"/api/products/{self.product.id}/reviews/",
+            reverse("product-reviews", args=[self.product.id]),
+        ):
+            with self.subTest(url=url):
+                self.assertRevalidates(url)
+
+    def test_changes_produce_new_etag(self):
+        url = f"/api/products/{self.product.id}/reviews/"
+        etag = self.assertRevalidates(url)
+        review = Review.objects.create(
+            product=self.product, user=self.buyer, rating=3, comment="Ok"
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response["ETag"]
+        review.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_review_changes_product_validators(self):
+        url = f"/api/stores/{self.store.id}/products/"
+        etag = self.assertRevalidates(url)
+        Review.objects.create(product=self.product, user=self.buyer, rating=5, comment="Great")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_varies_with_query_string(self):
+        etag = self.assertRevalidates("/api/products/")
+        response = self.client.get("/api/products/", {"page_size": 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_expanded_requests_are_not_conditional(self):
+        response = self.client.get("/api/products/", {"expand": "store"})
+        self.assertNotIn("ETag", response)
+
+
+# --------------------------
+# Object Cache Tests
+# --------------------------
+class ObjectCacheTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.buyer = User.objects.create_user(username="buyer", password="pass", role="buyer")
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Test Store", owner=self.vendor)
+        self.product = Product.objects.create(store=self.store, name="Shirt", price=50, stock=10)
+
+    def test_second_lookup_is_a_hit(self):
+        hits, misses = product_cache.stats["hits"], product_cache.stats["misses"]
+        product_cache.get(self.product.pk)
+        with self.assertNumQueries(0):
+            product = product_cache.get(self.product.pk)
+        self.assertEqual(product, self.product)
+        self.assertEqual(product.price, 50)
+        self.assertFalse(product._state.adding)
+        self.assertEqual(product_cache.stats["hits"] - hits, 1)
+        self.assertEqual(product_cache.stats["misses"] - misses, 1)
+
+    def test_lost_version_does_not_revive_old_rows(self):
+        version_key = store_cache._version_key(self.store.pk)
+        cache.delete(version_key)
+        store_cache.get(self.store.pk)
+        Store.objects.filter(pk=self.store.pk).update(name="New Name")
+        cache.delete(version_key)
+        self.assertEqual(store_cache.get(self.store.pk).name, "New Name")
+
+    def test_missing_rows_are_not_found(self):
+        self.assertIsNone(store_cache.get(self.store.pk + 100))
+        response = self.client.get(reverse("product_detail", args=[self.product.pk + 100]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_save_and_delete_invalidate(self):
+        store_cache.get(self.store.pk)
+        self.store.name = "New Name"
+        self.store.save()
+        self.assertEqual(store_cache.get(self.store.pk).name, "New Name")
+
+        product_cache.get(self.product.pk)
+        self.product.delete()
+        self.assertIsNone(product_cache.get(self.product.pk))
+
+    def test_review_refreshes_cached_rating(self):
+        product_cache.get(self.product.pk)
+        Review.objects.create(product=self.product, user=self.buyer, rating=4, comment="Ok")
+        product = product_cache.get(self.product.pk)
+        self.assertEqual(product.review_count, 1)
+        self.assertEqual(product.rating_average, 4)
+
+    def test_edit_product_saves_the_current_row(self):
+        self.client.login(username="vendor", password="pass")
+        url = reverse("edit_product", args=[self.product.pk])
+        self.client.get(url)
+        # Written behind the cache's back; the POST must not put back the cached count.
+        Product.objects.filter(pk=self.product.pk).update(review_count=2)
+        self.client.post(url, {"name": "Blouse", "description": "", "price": 60, "stock": 10})
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.review_count), ("Blouse", 2))
+        self.assertEqual(product_cache.get(self.product.pk).name, "Blouse")
+
+
+# --------------------------
+# Checkout Tests
+# --------------------------
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.buyer = User.objects.create_user(
+            username="buyer", password="pass", role="buyer", email="buyer@example.com"
+        )
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Test Store", owner=self.vendor)
+        self.cart = Cart.objects.create(user=self.buyer)
+
+    def fill_cart(self, count, stock=10, quantity=2):
+        products = Product.objects.bulk_create([
+            Product(store=self.store, name=f"Item {i}", price=5, stock=stock) for i in range(count)
+        ])
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product=product, quantity=quantity) for product in products
+        ])
+        return products
+
+    def test_checkout_decrements_stock_and_empties_cart(self):
+        products = self.fill_cart(2)
+        self.client.login(username="buyer", password="pass")
+        response = self.client.post(reverse("checkout"))
+        self.assertRedirects(response, reverse("product_list"))
+        order = Order.objects.get(user=self.buyer)
+        self.assertEqual(order.total, 20)
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(set(Product.objects.values_list("stock", flat=True)), {8})
+        self.assertFalse(self.cart.items.exists())
+        self.assertEqual(product_cache.get(products[0].pk).stock, 8)
+
+    def test_query_count_does_not_grow_with_cart(self):
+        self.fill_cart(1)
+        with self.assertNumQueries(10):
+            place_order(self.buyer, self.cart)
+        self.fill_cart(20)
+        with self.assertNumQueries(10):
+            place_order(self.buyer, self.cart)
+
+    def test_insufficient_stock_rolls_back(self):
+        products = self.fill_cart(2)
+        Product.objects.filter(pk=products[1].pk).update(stock=1)
+        with self.assertRaises(InsufficientStock) as raised:
+            place_order(self.buyer, self.cart)
+        self.assertEqual(raised.exception.products, [products[1]])
+        self.assertEqual(self.cart.items.count(), 2)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(pk=products[0].pk).stock, 10)
+
+    def test_insufficient_stock_returns_to_cart(self):
+        self.fill_cart(1, stock=1)
+        self.client.login(username="buyer", password="pass")
+        response = self.client.post(reverse("checkout"), follow=True)
+        self.assertRedirects(response, reverse("cart"))
+        self.assertContains(response, "Not enough stock for: Item 0")
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_cart_checked_out_twice_is_rejected(self):
+        self.fill_cart(1)
+        place_order(self.buyer, self.cart)
+        with self.assertRaises(CheckoutError):
+            place_order(self.buyer, self.cart)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get().stock, 8)
+
+
+# --------------------------
+# Email Outbox Tests
+# --------------------------
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPException("mail server unavailable")
+
+
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.buyer = User.objects.create_user(
+            username="buyer", password="pass", role="buyer", email="buyer@example.com"
+        )
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Test Store", owner=self.vendor)
+        self.product = Product.objects.create(store=self.store, name="Shirt", price=50, stock=10)
+
+    def test_checkout_queues_invoice(self):
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        self.client.login(username="buyer", password="pass")
+        response = self.client.post(reverse("checkout"), follow=True)
+        self.assertContains(response, "Your invoice will be emailed shortly.")
+        self.assertEqual(len(mail.outbox), 0)
+
+        out = StringIO()
+        call_command("send_outbox", stdout=out)
+        self.assertIn("Sent 1 emails", out.getvalue())
+        self.assertEqual(mail.outbox[0].to, ["buyer@example.com"])
+        self.assertIn("- Shirt (x2) = $100.00", mail.outbox[0].body)
+        self.assertIsNotNone(OutboxEmail.objects.get().sent_at)
+
+    def test_failed_checkout_queues_nothing(self):
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=20)
+        self.client.login(username="buyer", password="pass")
+        self.client.post(reverse("checkout"))
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_password_reset_is_queued(self):
+        response = self.client.post(
+            reverse("request_password_reset"), {"email": "buyer@example.com"}, follow=True
+        )
+        self.assertContains(response, "email you a reset link shortly")
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(deliver_batch(), (1, 0))
+        self.assertIn("/reset_password/", mail.outbox[0].body)
+
+    def test_emails_are_sent_in_batches(self):
+        for i in range(5):
+            queue_email(f"Hello {i}", "Body", ["a@example.com"])
+        self.assertEqual(deliver_batch(batch_size=2), (2, 0))
+        call_command("send_outbox", batch_size=2, stdout=StringIO())
+        self.assertEqual([m.subject for m in mail.outbox], [f"Hello {i}" for i in range(5)])
+        self.assertEqual(deliver_batch(), (0, 0))
+
+    @override_settings(
+        EMAIL_BACKEND="chiecouture.tests.FailingEmailBackend",
+        OUTBOX_RETRY_DELAY=60,
+        OUTBOX_MAX_ATTEMPTS=2,
+    )
+    def test_failures_are_retried_with_backoff(self):
+        email = queue_email("Hello", "Body", ["a@example.com"])
+        self.assertEqual(deliver_batch(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 1)
+        self.assertIn("unavailable", email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=50))
+        # Not due yet.
+        self.assertEqual(deliver_batch(), (0, 0))
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(deliver_batch(), (0, 1))
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        # Gave up after OUTBOX_MAX_ATTEMPTS.
+        self.assertEqual(deliver_batch(), (0, 0))
+
+
+# --------------------------
+# Session Cart Tests
+# --------------------------
+class SessionCartTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.buyer = User.objects.create_user(username="buyer", password="pass", role="buyer")
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Test Store", owner=self.vendor)
+        self.shirt = Product.objects.create(store=self.store, name="Shirt", price=50, stock=10)
+        self.hat = Product.objects.create(store=self.store, name="Hat", price=20, stock=10)
+
+    def add(self, product, quantity=1):
+        return self.client.post(reverse("add_to_cart", args=[product.id]), {"quantity": quantity})
+
+    def test_anonymous_cart_is_merged_on_login(self):
+        self.add(self.shirt, 2)
+        self.add(self.hat)
+        self.assertFalse(CartItem.objects.exists())
+
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=self.shirt, quantity=1)
+        self.client.login(username="buyer", password="pass")
+        quantities = dict(cart.items.values_list("product__name", "quantity"))
+        self.assertEqual(quantities, {"Shirt": 3, "Hat": 1})
+
+    def test_anonymous_cart_is_kept_on_registration(self):
+        self.add(self.shirt, 2)
+        response = self.client.post(
+            reverse("register"),
+            {"username": "newbuyer", "email": "new@example.com", "role": "buyer",
+             "password1": "Complexpass123", "password2": "Complexpass123"},
+        )
+        self.assertEqual(response.status_code, 302)
+        cart = Cart.objects.get(user__username="newbuyer")
+        self.assertEqual(list(cart.items.values_list("product__name", "quantity")), [("Shirt", 2)])
+
+    def test_adds_are_persisted_in_batches(self):
+        self.client.login(username="buyer", password="pass")
+        # Within CART_PERSIST_INTERVAL of the last write adds stay in the session...
+        self.add(self.shirt)
+        self.add(self.shirt, 2)
+        self.add(self.hat)
+        self.assertFalse(CartItem.objects.exists())
+        # ...until the cart is looked at.
+        response = self.client.get(reverse("cart"))
+        self.assertEqual(response.context["pricing"].subtotal, 170)
+        self.assertEqual(CartItem.objects.get(product=self.shirt).quantity, 3)
+
+        with self.settings(CART_PERSIST_INTERVAL=0):
+            self.add(self.hat)
+        self.assertEqual(CartItem.objects.get(product=self.hat).quantity, 2)
+
+    def test_pending_adds_are_persisted_on_logout(self):
+        self.client.login(username="buyer", password="pass")
+        self.add(self.shirt)
+        self.add(self.hat)
+        self.assertFalse(CartItem.objects.exists())
+
+        self.client.post(reverse("logout"))
+        self.client.login(username="buyer", password="pass")
+        response = self.client.get(reverse("cart"))
+        self.assertEqual(response.context["pricing"].subtotal, 70)
+
+    def test_add_returns_to_referring_page(self):
+        url = reverse("product_detail", args=[self.shirt.id])
+        response = self.client.post(
+            reverse("add_to_cart", args=[self.shirt.id]), HTTP_REFERER=f"http://testserver{url}"
+        )
+        self.assertRedirects(response, f"http://testserver{url}", fetch_redirect_response=False)
+        response = self.client.post(
+            reverse("add_to_cart", args=[self.shirt.id]), HTTP_REFERER="http://evil.example/"
+        )
+        self.assertRedirects(response, reverse("cart"), fetch_redirect_response=False)
+
+    def test_deleted_products_are_dropped(self):
+        self.add(self.shirt)
+        self.add(self.hat)
+        self.hat.delete()
+        self.client.login(username="buyer", password="pass")
+        self.assertEqual(list(CartItem.objects.values_list("product__name", flat=True)), ["Shirt"])
+
+    def test_checkout_includes_pending_items(self):
+        self.client.login(username="buyer", password="pass")
+        self.add(self.shirt)
+        self.add(self.hat)
+        self.client.post(reverse("checkout"))
+        self.assertEqual(Order.objects.get().total, 70)
+
+
+# --------------------------
+# Cart Update Tests
+# --------------------------
+class CartUpdateTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.buyer = User.objects.create_user(username="buyer", password="pass", role="buyer")
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Test Store", owner=self.vendor)
+        self.cart = Cart.objects.create(user=self.buyer)
+
+    def fill_cart(self, count):
+        products = Product.objects.bulk_create([
+            Product(store=self.store, name=f"Item {i}", price=5, stock=10) for i in range(count)
+        ])
+        return CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product=product, quantity=1) for product in products
+        ])
+
+    def test_query_count_does_not_grow_with_cart(self):
+        for count in (2, 30):
+            items = self.fill_cart(count)
+            quantities = {items[0].pk: 0, **{item.pk: 3 for item in items[1:]}}
+            # select, bulk update and delete inside a savepoint, then the new pricing
+            with self.assertNumQueries(6):
+                update_quantities(self.buyer, quantities)
+            self.assertEqual(self.cart.items.count(), count - 1)
+            self.cart.items.all().delete()
+
+    def test_update_cart_view(self):
+        keep, remove = self.fill_cart(2)
+        other_cart = Cart.objects.create(user=self.vendor)
+        other = CartItem.objects.create(cart=other_cart, product=keep.product, quantity=1)
+        self.client.login(username="buyer", password="pass")
+        response = self.client.post(reverse("update_cart"), {
+            f"quantity_{keep.pk}": "4",
+            f"quantity_{remove.pk}": "0",
+            f"quantity_{other.pk}": "0",
+            "quantity_x": "1",
+        }, follow=True)
+        self.assertContains(response, "Cart updated. Total: £20.00")
+        self.assertEqual(list(self.cart.items.values_list("quantity", flat=True)), [4])
+        self.assertTrue(CartItem.objects.filter(pk=other.pk).exists())
+
+
+# --------------------------
+# Cart Pricing Tests
+# --------------------------
+class CartPricingTests(TestCase):
+    def setUp(self):
+        # Cart ids are reused between tests, so cached pricings would carry over.
+        cache.clear()
+        self.client = Client()
+        self.buyer = User.objects.create_user(username="buyer", password="pass", role="buyer")
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Test Store", owner=self.vendor)
+        self.shirt = Product.objects.create(store=self.store, name="Shirt", price="19.99", stock=10)
+        self.hat = Product.objects.create(store=self.store, name="Hat", price="0.10", stock=10)
+        self.cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=self.cart, product=self.shirt, quantity=3)
+        CartItem.objects.create(cart=self.cart, product=self.hat, quantity=3)
+
+    def test_totals_are_exact_decimals(self):
+        with self.assertNumQueries(1):
+            pricing = price_cart(self.cart.pk)
+        self.assertEqual([line.line_total for line in pricing], [Decimal("59.97"), Decimal("0.30")])
+        self.assertEqual(pricing.subtotal, Decimal("60.27"))
+        self.assertEqual(pricing.item_count, 6)
+
+    def test_pricing_is_cached_until_cart_or_prices_change(self):
+        price_cart(self.cart.pk)
+        with self.assertNumQueries(0):
+            price_cart(self.cart.pk)
+
+        merge_into_cart(self.buyer, {self.hat.pk: 1})
+        self.assertEqual(price_cart(self.cart.pk).item_count, 7)
+
+        self.shirt.price = Decimal("10.00")
+        self.shirt.save()
+        self.assertEqual(price_cart(self.cart.pk).subtotal, Decimal("30.40"))
+
+    def test_saves_that_keep_prices_keep_cached_pricing(self):
+        price_cart(self.cart.pk)
+        self.shirt.stock = 5
+        self.shirt.save()
+        Product.objects.create(store=self.store, name="Scarf", price="5.00", stock=1)
+        with self.assertNumQueries(0):
+            price_cart(self.cart.pk)
+
+    def test_renaming_or_moving_a_product_refreshes_cached_pricing(self):
+        price_cart(self.cart.pk)
+        self.shirt.name = "Linen Shirt"
+        self.shirt.save()
+        self.assertEqual(price_cart(self.cart.pk).lines[0].name, "Linen Shirt")
+
+        other_vendor = User.objects.create_user(username="other", password="pass", role="vendor")
+        other_store = Store.objects.create(name="Other Store", owner=other_vendor)
+        self.shirt.store = other_store
+        self.shirt.save(update_fields=["store"])
+        self.assertEqual(price_cart(self.cart.pk).lines[0].store_id, other_store.pk)
+
+    def test_cart_and_checkout_pages_use_pricing(self):
+        self.client.login(username="buyer", password="pass")
+        self.assertContains(self.client.get(reverse("cart")), "£60.27")
+        self.assertContains(self.client.get(reverse("checkout")), "£59.97")
+
+        item = self.cart.items.get(product=self.hat)
+        self.client.get(reverse("remove_from_cart", args=[item.pk]))
+        self.assertContains(self.client.get(reverse("cart")), "Total: £59.97")
+        self.client.post(reverse("checkout"))
+        self.assertEqual(Order.objects.get().total, Decimal("59.97"))
+        self.assertEqual(OrderItem.objects.get().price, Decimal("19.99"))
+
+
+# --------------------------
+# Idempotency Key Tests
+# --------------------------
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        # Stored responses would otherwise carry over between tests.
+        cache.clear()
+        self.client = Client()
+        self.buyer = User.objects.create_user(
+            username="buyer", password="pass", role="buyer", email="buyer@example.com"
+        )
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Test Store", owner=self.vendor)
+        self.product = Product.objects.create(store=self.store, name="Shirt", price=50, stock=10)
+        for user in (self.buyer, self.vendor):
+            order = Order.objects.create(user=user, total=50)
+            OrderItem.objects.create(order=order, product=self.product, quantity=1, price=50)
+
+    def test_checkout_retry_is_replayed(self):
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        self.client.login(username="buyer", password="pass")
+        first = self.client.post(reverse("checkout"), HTTP_IDEMPOTENCY_KEY="order-1")
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        retry = self.client.post(reverse("checkout"), HTTP_IDEMPOTENCY_KEY="order-1")
+        self.assertEqual(retry.status_code, first.status_code)
+        self.assertEqual(retry["Location"], first["Location"])
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.filter(user=self.buyer).count(), 2)
+
+        self.client.post(reverse("checkout"), HTTP_IDEMPOTENCY_KEY="order-2")
+        self.assertEqual(Order.objects.filter(user=self.buyer).count(), 3)
+
+    def test_api_writes_are_replayed(self):
+        self.client.login(username="vendor", password="pass")
+        url = f"/api/stores/{self.store.id}/products/"
+        data = {"name": "Hat", "description": "", "price": "20.00", "stock": 5}
+        first = self.client.post(url, data, content_type="application/json",
+                                 HTTP_IDEMPOTENCY_KEY="k")
+        retry = self.client.post(url, data, content_type="application/json",
+                                 HTTP_IDEMPOTENCY_KEY="k")
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Product.objects.filter(name="Hat").count(), 1)
+
+        url = f"/api/products/{self.product.id}/reviews/"
+        review = {"rating": 5, "comment": "Great"}
+        for _ in range(2):
+            self.client.post(url, review, content_type="application/json", HTTP_IDEMPOTENCY_KEY="r")
+        self.assertEqual(Review.objects.count(), 1)
+
+    def test_key_reused_with_other_body_is_rejected(self):
+        self.client.login(username="vendor", password="pass")
+        url = f"/api/products/{self.product.id}/reviews/"
+        self.client.post(url, {"rating": 5, "comment": "Great"},
+                         content_type="application/json", HTTP_IDEMPOTENCY_KEY="r")
+        response = self.client.post(url, {"rating": 1, "comment": "Bad"},
+                                    content_type="application/json", HTTP_IDEMPOTENCY_KEY="r")
+        self.assertEqual(response.status_code, 422)
+
+    def test_keys_are_scoped_to_the_client(self):
+        url = f"/api/products/{self.product.id}/reviews/"
+        review = {"rating": 5, "comment": "Great"}
+        for username in ("vendor", "buyer"):
+            self.client.login(username=username, password="pass")
+            self.client.post(url, review, content_type="application/json", HTTP_IDEMPOTENCY_KEY="r")
+        self.assertEqual(Review.objects.count(), 2)
+
+    def test_large_upload_is_fingerprinted_without_reading_body(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.client.login(username="vendor", password="pass")
+        url = f"/api/stores/{self.store.id}/products/"
+        with override_settings(MEDIA_ROOT=media_root, DATA_UPLOAD_MAX_MEMORY_SIZE=1024):
+            for _ in range(2):
+                data = {"name": "Hat", "price": "20.00", "stock": 5, "image": image_upload()}
+                response = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="upload")
+                self.assertEqual(response.status_code, 201)
+        self.assertEqual(response["Idempotent-Replayed"], "true")
+        self.assertEqual(Product.objects.filter(name="Hat").count(), 1)
+
+    def test_anonymous_clients_are_scoped_by_session(self):
+        request = RequestFactory().post("/")
+        request.user = AnonymousUser()
+        self.assertIsNone(request_scope(request))
+        scopes = set()
+        for session_key in ("a" * 32, "b" * 32):
+            request.session = SessionStore(session_key)
+            scopes.add(request_scope(request))
+        self.assertEqual(len(scopes), 2)
+
+    def test_requests_without_key_are_unaffected(self):
+        self.client.login(username="vendor", password="pass")
+        url = f"/api/products/{self.product.id}/reviews/"
+        for _ in range(2):
+            self.client.post(
+                url, {"rating": 5, "comment": "Great"}, content_type="application/json"
+            )
+        self.assertEqual(Review.objects.count(), 2)
+
+
+# --------------------------
+# Stock Reservation Tests
+# --------------------------
+class StockReservationTests(TestCase):
+    def setUp(self):
+        # Cart ids are reused between tests, so cached pricings would carry over.
+        cache.clear()
+        self.client = Client()
+        self.buyer = User.objects.create_user(username="buyer", password="pass", role="buyer")
+        self.other = User.objects.create_user(username="other", password="pass", role="buyer")
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Test Store", owner=self.vendor)
+        self.product = Product.objects.create(store=self.store, name="Shirt", price=50, stock=3)
+
+    def refresh(self):
+        self.product.refresh_from_db()
+        return self.product
+
+    def test_holds_reduce_available_stock(self):
+        hold_stock(self.buyer, {self.product.pk: 2})
+        self.assertEqual((self.refresh().reserved_stock, self.product.available_stock), (2, 1))
+        with self.assertRaises(InsufficientStock):
+            hold_stock(self.other, {self.product.pk: 2})
+        # Holding again replaces the earlier hold instead of adding to it.
+        hold_stock(self.buyer, {self.product.pk: 3})
+        self.assertEqual(self.refresh().reserved_stock, 3)
+        self.assertEqual(StockReservation.objects.get().quantity, 3)
+
+    def test_order_uses_up_the_hold(self):
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        self.client.login(username="buyer", password="pass")
+        response = self.client.post(reverse("start_checkout"), follow=True)
+        self.assertContains(response, "reserved for you until")
+        self.assertEqual(self.refresh().available_stock, 1)
+
+        with self.assertRaises(InsufficientStock):
+            hold_stock(self.other, {self.product.pk: 2})
+        self.client.post(reverse("checkout"))
+        self.assertEqual((self.refresh().stock, self.product.reserved_stock), (1, 0))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_viewing_checkout_holds_nothing(self):
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        self.client.login(username="buyer", password="pass")
+        response = self.client.get(reverse("checkout"))
+        self.assertContains(response, "Complete Order")
+        self.assertNotContains(response, "reserved for you until")
+        self.assertEqual(self.refresh().reserved_stock, 0)
+        self.assertFalse(StockReservation.objects.exists())
+        # A GET of the start URL does not hold either.
+        self.assertRedirects(self.client.get(reverse("start_checkout")), reverse("checkout"))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_order_cannot_take_held_stock(self):
+        hold_stock(self.other, {self.product.pk: 2})
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        self.client.login(username="buyer", password="pass")
+        response = self.client.post(reverse("start_checkout"), follow=True)
+        self.assertContains(response, "Not enough stock for: Shirt")
+        self.client.post(reverse("checkout"))
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.refresh().stock, 3)
+
+    def test_expired_holds_are_released_in_batches(self):
+        hold_stock(self.buyer, {self.product.pk: 1})
+        hold_stock(self.other, {self.product.pk: 2})
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(release_expired(batch_size=1), 1)
+        out = StringIO()
+        call_command("expire_reservations", stdout=out)
+        self.assertIn("Released 1 expired", out.getvalue())
+        self.assertEqual(self.refresh().reserved_stock, 0)
+
+    def test_edit_product_keeps_reserved_stock(self):
+        hold_stock(self.buyer, {self.product.pk: 2})
+        self.client.login(username="vendor", password="pass")
+        self.client.post(reverse("edit_product", args=[self.product.pk]),
+                         {"name": "Shirt", "description": "", "price": 50, "stock": 5})
+        self.assertEqual((self.refresh().stock, self.product.reserved_stock), (5, 2))
+
+
+class StockReservationConcurrencyTests(TransactionTestCase):
+    def test_concurrent_holds_never_oversell(self):
+        vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        store = Store.objects.create(name="Test Store", owner=vendor)
+        product = Product.objects.create(store=store, name="Sneaker", price=100, stock=5)
+        buyers = [
+            User.objects.create_user(username=f"buyer{i}", password="pass") for i in range(20)
+        ]
+        outcomes = []
+
+        def race(user):
+            try:
+                while True:
+                    try:
+                        hold_stock(user, {product.pk: 1})
+                        outcomes.append("held")
+                        return
+                    except InsufficientStock:
+                        outcomes.append("sold out")
+                        return
+                    except OperationalError:
+                        # SQLite allows one writer at a time; try again shortly.
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=race, args=(user,)) for user in buyers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(outcomes.count("held"), 5)
+        self.assertEqual(outcomes.count("sold out"), 15)
+        self.assertEqual(product.reserved_stock, 5)
+        self.assertEqual(StockReservation.objects.count(), 5)
+
+
+# --------------------------
+# Order History Tests
+# --------------------------
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.buyer = User.objects.create_user(
+            username="buyer", password="pass", role="buyer", email="buyer@example.com"
+        )
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Test Store", owner=self.vendor)
+        self.product = Product.objects.create(store=self.store, name="Shirt", price=50, stock=10)
+        self.cart = Cart.objects.create(user=self.buyer)
+        for quantity in (1, 2, 3):
+            CartItem.objects.create(cart=self.cart, product=self.product, quantity=quantity)
+            place_order(self.buyer, self.cart)
+        self.client.login(username="buyer", password="pass")
+
+    def assertNoProductQueries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        for query in queries:
+            self.assertNotIn(Product._meta.db_table + '"', query["sql"])
+        return response
+
+    def test_checkout_snapshots_lines(self):
+        item = OrderItem.objects.first()
+        self.assertEqual(
+            (item.product_name, item.store_id, item.price), ("Shirt", self.store.id, 50)
+        )
+
+    def test_api_lists_own_orders_newest_first(self):
+        other = Order.objects.create(user=self.vendor, total=1)
+        response = self.assertNoProductQueries("/api/orders/", {"page_size": 2})
+        data = response.json()
+        self.assertEqual([o["items"][0]["quantity"] for o in data["results"]], [3, 2])
+        self.assertEqual(data["results"][0]["items"][0]["product_name"], "Shirt")
+        self.assertNotIn(other.id, [o["id"] for o in data["results"]])
+        rest = self.client.get(data["next"]).json()
+        self.assertEqual([o["items"][0]["quantity"] for o in rest["results"]], [1])
+        self.assertEqual(self.client.get(f"/api/orders/{other.id}/").status_code, 404)
+
+    def test_orders_page_survives_product_deletion(self):
+        product_url = reverse("product_detail", args=[self.product.id])
+        self.product.delete()
+        response = self.assertNoProductQueries(reverse("order_history"), {"page_size": 2})
+        self.assertContains(response, "Shirt\n              (x3)")
+        self.assertNotContains(response, product_url)
+        self.assertTrue(response.context["orders"].has_next)
+        self.assertEqual(OrderItem.objects.filter(product__isnull=True).count(), 3)
+
+    def test_orders_require_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get("/api/orders/").status_code, 401)
+        self.assertEqual(self.client.get(reverse("order_history")).status_code, 302)
+
+
+# --------------------------
+# Purchase Index Tests
+# --------------------------
+class PurchaseIndexTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.buyer = User.objects.create_user(
+            username="buyer", password="pass", role="buyer", email="buyer@example.com"
+        )
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Test Store", owner=self.vendor)
+        self.product = Product.objects.create(store=self.store, name="Shirt", price=50, stock=10)
+
+    def buy(self, quantity=1):
+        cart, _ = Cart.objects.get_or_create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=quantity)
+        place_order(self.buyer, cart)
+
+    def test_checkout_records_purchase_once(self):
+        self.buy()
+        self.buy()
+        self.assertEqual(Purchase.objects.count(), 1)
+        with self.assertNumQueries(1):
+            self.assertTrue(Purchase.has_bought(self.buyer, self.product))
+        self.assertFalse(Purchase.has_bought(self.vendor, self.product))
+
+    def test_reviews_are_verified_from_index(self):
+        self.client.login(username="vendor", password="pass")
+        url = f"/api/products/{self.product.id}/reviews/"
+        review = {"rating": 4, "comment": "Ok"}
+        response = self.client.post(url, review, content_type="application/json")
+        self.assertFalse(response.json()["verified"])
+
+        self.buy()
+        self.client.login(username="buyer", password="pass")
+        review = {"rating": 5, "comment": "Great"}
+        response = self.client.post(url, review, content_type="application/json")
+        self.assertTrue(response.json()["verified"])
+        self.client.post(reverse("product_detail", args=[self.product.id]),
+                         {"rating": 5, "comment": "Still great"})
+        self.assertTrue(Review.objects.get(comment="Still great").verified)
+
+    def test_backfill_from_orders(self):
+        order = Order.objects.create(user=self.buyer, total=100)
+        OrderItem.objects.create(order=order, product=self.product, quantity=1, price=50)
+        OrderItem.objects.create(order=order, product=self.product, quantity=1, price=50)
+        out = StringIO()
+        call_command("rebuild_purchase_index", stdout=out)
+        call_command("rebuild_purchase_index", stdout=StringIO())
+        self.assertIn("Indexed 1 purchases", out.getvalue())
+        self.assertTrue(Purchase.has_bought(self.buyer, self.product))
+        self.assertEqual(Purchase.objects.count(), 1)
+
+    def test_deleting_product_removes_purchases(self):
+        self.buy()
+        self.product.delete()
+        self.assertFalse(Purchase.objects.exists())
+
+
+# --------------------------
+# Review Stream Tests
+# --------------------------
+class ReviewStreamTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Test Store", owner=self.vendor)
+        self.product = Product.objects.create(store=self.store, name="Shirt", price=50, stock=10)
+        self.buyers = User.objects.bulk_create(
+            User(username=f"buyer{i}", password="pass", role="buyer") for i in range(5)
+        )
+        self.add_reviews(30)
+
+    def add_reviews(self, count):
+        Review.objects.bulk_create(
+            Review(
+                product=self.product, store=self.store, user=self.buyers[i % 5], rating=4,
+                comment=f"Review {i}",
+            )
+            for i in range(count)
+        )
+
+    def newest_first(self):
+        return list(Review.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+
+    def test_store_is_copied_from_product(self):
+        review = Review.objects.create(
+            product=self.product, user=self.buyers[0], rating=5, comment="Great"
+        )
+        self.assertEqual(review.store_id, self.store.id)
+        self.assertIn(review, self.store.reviews.all())
+
+    def test_product_page_pages_through_reviews(self):
+        url = reverse("product_detail", args=[self.product.id])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as small:
+            first = self.client.get(url)
+        reviews = first.context["reviews"]
+        self.assertEqual([r.id for r in reviews], self.newest_first()[:24])
+        self.assertContains(first, "Older Reviews")
+        rest = self.client.get(f"{url}?{reviews.next_query}").context["reviews"]
+        self.assertEqual([r.id for r in rest], self.newest_first()[24:])
+        self.assertFalse(rest.has_next)
+
+        self.add_reviews(500)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(url)
+        self.assertEqual(len(large), len(small))
+
+    def test_api_loads_more_reviews(self):
+        url = f"/api/products/{self.product.id}/reviews/?page_size=8"
+        ids = []
+        while url:
+            # validators, product, one page of reviews
+            with self.assertNumQueries(3):
+                data = self.client.get(url).json()
+            ids += [review["id"] for review in data["results"]]
+            url = data["next"]
+        self.assertEqual(ids, self.newest_first())
+        data = self.client.get(reverse("product-reviews", args=[self.product.id])).json()
+        self.assertEqual([review["id"] for review in data["results"]], self.newest_first()[:24])
+
+    def test_vendor_pages_show_latest_reviews(self):
+        self.client.login(username="vendor", password="pass")
+        with self.assertNumQueries(5):
+            dashboard = self.client.get(reverse("store_dashboard"))
+        self.assertEqual([r.id for r in dashboard.context["reviews"]], self.newest_first()[:5])
+        response = self.client.get(reverse("vendor-reviews"))
+        self.assertEqual([r.id for r in response.context["reviews"]], self.newest_first()[:24])
+        self.assertContains(response, "Older Reviews")
+        self.assertContains(response, "buyer1")
+
+
+# --------------------------
+# Announcement Tests
+# --------------------------
+class FailingTransport:
+    def send(self, text):
+        raise ConnectionError("API unavailable")
+
+
+class RateLimitedTransport(MemoryTransport):
+    """Accepts one post, then reports a two minute rate limit."""
+
+    def send(self, text):
+        if self.sent:
+            raise RateLimited(120)
+        super().send(text)
+
+
+@override_settings(ANNOUNCEMENT_TRANSPORT="chiecouture.announcements.MemoryTransport")
+class AnnouncementTests(TestCase):
+    def setUp(self):
+        # Each test posts through a transport of its own.
+        integrations.reset()
+        self.client = Client()
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+
+    def tearDown(self):
+        integrations.reset()
+
+    @property
+    def sent(self):
+        return integrations.get("announcements").sent
+
+    def test_new_store_and_product_are_queued_once(self):
+        self.client.login(username="vendor", password="pass")
+        self.client.post(reverse("create_store"), {"name": "Test Store", "description": "Shop"})
+        self.client.post(
+            reverse("add_product"),
+            {"name": "Shirt", "description": "Cotton", "price": "50", "stock": "10"},
+        )
+        product = Product.objects.get()
+        announce_product(product)
+        product.save()
+        self.assertEqual(Announcement.objects.count(), 2)
+        self.assertEqual(self.sent, [])
+
+        out = StringIO()
+        call_command("dispatch_announcements", stdout=out)
+        self.assertIn("Posted 2 announcements", out.getvalue())
+        self.assertEqual(self.sent, [
+            "A new store has been added: Test Store! Check it out now.",
+            "Test Store just added a new product: Shirt! Take a look.",
+        ])
+        self.assertEqual(dispatch_batch(), (0, 0))
+
+    def test_announcements_are_sent_in_batches(self):
+        store = Store.objects.create(name="Test Store", owner=self.vendor)
+        Product.objects.bulk_create(
+            Product(store=store, name=f"Item {i}", price=10, stock=1) for i in range(4)
+        )
+        for product in Product.objects.order_by("id"):
+            announce_product(product)
+        self.assertEqual(dispatch_batch(batch_size=2), (2, 0))
+        call_command("dispatch_announcements", batch_size=2, stdout=StringIO())
+        self.assertEqual(len(self.sent), 5)
+
+    @override_settings(
+        ANNOUNCEMENT_TRANSPORT="chiecouture.tests.FailingTransport",
+        ANNOUNCEMENT_RETRY_DELAY=60,
+        ANNOUNCEMENT_MAX_ATTEMPTS=2,
+    )
+    def test_failures_are_retried_with_backoff(self):
+        Store.objects.create(name="Test Store", owner=self.vendor)
+        self.assertEqual(dispatch_batch(), (0, 1))
+        announcement = Announcement.objects.get()
+        self.assertEqual(announcement.attempts, 1)
+        self.assertIn("unavailable", announcement.last_error)
+        self.assertGreater(announcement.next_attempt_at, timezone.now() + timedelta(seconds=50))
+        self.assertEqual(dispatch_batch(), (0, 0))
+
+        Announcement.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(dispatch_batch(), (0, 1))
+        Announcement.objects.update(next_attempt_at=timezone.now())
+        # Gave up after ANNOUNCEMENT_MAX_ATTEMPTS.
+        self.assertEqual(dispatch_batch(), (0, 0))
+
+    @override_settings(ANNOUNCEMENT_TRANSPORT="chiecouture.tests.RateLimitedTransport")
+    def test_rate_limit_defers_rest_of_batch(self):
+        store = Store.objects.create(name="Test Store", owner=self.vendor)
+        Product.objects.create(store=store, name="Shirt", price=50, stock=10)
+        Product.objects.create(store=store, name="Hat", price=20, stock=10)
+        self.assertEqual(dispatch_batch(), (1, 0))
+        waiting = Announcement.objects.filter(sent_at__isnull=True)
+        self.assertEqual(waiting.count(), 2)
+        for announcement in waiting:
+            self.assertEqual(announcement.attempts, 0)
+            self.assertGreater(
+                announcement.next_attempt_at, timezone.now() + timedelta(seconds=110)
+            )
+        self.assertEqual(dispatch_batch(), (0, 0))
+
+
+# --------------------------
+# Startup Tests
+# --------------------------
+class StartupTests(SimpleTestCase):
+    def test_setup_is_fast_and_skips_integrations(self):
+        report = measure_startup()
+        self.assertIn("chiecouture.views", report.modules)
+        self.assertEqual(set(LAZY_MODULES) & report.modules, set())
+        self.assertLess(report.seconds, STARTUP_BUDGET)
+
+    def test_parse_importtime(self):
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |     json.decoder\n"
+            "import time:        80 |        200 |   json\n"
+        )
+        self.assertEqual(parse_importtime(output), [
+            ("json.decoder", 120, 120, 2),
+            ("json", 80, 200, 1),
+        ])
+
+    def test_report_command(self):
+        out = StringIO()
+        call_command("startup_report", limit=3, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertRegex(lines[0], r"^Startup: \d+ ms wall clock$")
+        # Which modules are slowest varies between runs; the layout does not.
+        imports = lines.index("Slowest imports (cumulative, top 3):")
+        packages = lines.index("Packages by own import time (top 3):")
+        self.assertEqual(packages - imports, 5)
+        for line in lines[imports + 1:imports + 4] + lines[packages + 1:packages + 4]:
+            self.assertRegex(line, r"^ +[\d.]+ ms  \S+$")
+
+
+@override_settings(ANNOUNCEMENT_TRANSPORT="chiecouture.announcements.MemoryTransport")
+class IntegrationRegistryTests(SimpleTestCase):
+    def tearDown(self):
+        integrations.reset()
+
+    def test_built_once_on_first_use(self):
+        transport = integrations.get("announcements")
+        self.assertIsInstance(transport, MemoryTransport)
+        self.assertIs(integrations.get("announcements"), transport)
+
+    def test_rebuilt_when_setting_changes(self):
+        integrations.get("announcements")
+        with self.settings(ANNOUNCEMENT_TRANSPORT="chiecouture.tests.FailingTransport"):
+            self.assertIsInstance(integrations.get("announcements"), FailingTransport)
+        self.assertIsInstance(integrations.get("announcements"), MemoryTransport)
+
+
+# --------------------------
+# Image Rendition Tests
+# --------------------------
+def image_upload(name="photo.jpg", size=(800, 600), fmt="JPEG"):
+    buffer = BytesIO()
+    Image.new("RGB", size, "teal").save(buffer, format=fmt)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f"image/{fmt.lower()}")
+
+
+class TempMediaMixin:
+    """Uploads go to a throwaway MEDIA_ROOT."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.client = Client()
+        self.vendor = User.objects.create_user(username="vendor", password="pass", role="vendor")
+        self.store = Store.objects.create(name="Test Store", owner=self.vendor)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+
+class RenditionTests(TempMediaMixin, TestCase):
+
+    def test_upload_makes_renditions(self):
+        self.client.login(username="vendor", password="pass")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("add_product"), {
+                "name": "Shirt", "description": "Cotton", "price": "50", "stock": "10",
+                "image": image_upload(),
+            })
+        product = Product.objects.get()
+        self.assertEqual(product.image_widths, [160, 320, 640])
+        storage = product.image.storage
+        for width in (160, 320, 640):
+            for fmt in ("webp", "jpeg"):
+                name = rendition_name(product.image.name, width, fmt)
+                with storage.open(name) as f:
+                    self.assertEqual(Image.open(f).size, (width, width * 3 // 4))
+
+        response = self.client.get(reverse("product_detail", args=[product.id]))
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, rendition_name(product.image.url, 640, "jpeg") + " 640w")
+
+    def test_small_png_keeps_original(self):
+        badge = image_upload("badge.png", (120, 120), "PNG")
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(store=self.store, name="Badge", price=5, image=badge)
+        self.assertEqual(product.image_widths, [])
+        self.store.logo = image_upload("logo.png", (400, 400), "PNG")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.store.save()
+        self.assertEqual(Store.objects.get().logo_widths, [160, 320])
+        self.assertTrue(self.store.logo.storage.exists(
+            rendition_name(self.store.logo.name, 320, "png")
+        ))
+
+    def test_clearing_image_drops_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                store=self.store, name="Shirt", price=5, image=image_upload()
+            )
+        product.image = ""
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(Product.objects.get().image_widths, [])
+
+    def test_renditions_wait_for_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            product = Product.objects.create(
+                store=self.store, name="Shirt", price=5, image=image_upload()
+            )
+        self.assertEqual(Product.objects.get().image_widths, [])
+        self.assertFalse(
+            product.image.storage.exists(rendition_name(product.image.name, 160, "webp"))
+        )
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Product.objects.get().image_widths, [160, 320, 640])
+
+    def test_large_jpeg_is_decoded_at_reduced_size(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                store=self.store, name="Poster", price=5, image=image_upload(size=(4000, 3000))
+            )
+        self.assertEqual(product.image_widths, [160, 320, 640, 1280])
+        name = rendition_name(product.image.name, 1280, "jpeg")
+        with product.image.storage.open(name) as f:
+            self.assertEqual(Image.open(f).size, (1280, 960))
+
+    def test_api_srcset(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                store=self.store, name="Shirt", price=5, image=image_upload()
+            )
+        data = self.client.get(f"/api/products/{product.id}/").json()
+        self.assertEqual(set(data["image_srcset"]), {"webp", "jpeg"})
+        webp = data["image_srcset"]["webp"]
+        self.assertTrue(webp.startswith("http://testserver/media/products/"))
+        self.assertTrue(webp.endswith(" 640w"))
+
+    def test_backfill_uses_process_pool(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                store=self.store, name="Shirt", price=5, image=image_upload()
+            )
+        Product.objects.update(image_widths=[])
+        Store.objects.filter(pk=self.store.pk).update(logo="broken.png")
+        with open(f"{self.media_root}/broken.png", "wb"):
+            pass
+        out, err = StringIO(), StringIO()
+        call_command("rebuild_renditions", workers=2, stdout=out, stderr=err)
+        self.assertIn("Rendered 1 images, 1 failed", out.getvalue())
+        self.assertIn(f"chiecouture.Store #{self.store.pk}", err.getvalue())
+        product.refresh_from_db()
+        self.assertEqual(product.image_widths, [160, 320, 640])
+
+
+# --------------------------
+# Media Storage Tests
+# --------------------------
+class ContentAddressedStorageTests(TempMediaMixin, TestCase):
+    def add_product(self, upload, name="Shirt"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(store=self.store, name=name, price=5, image=upload)
+
+    def stored_files(self):
+        return sorted(os.listdir(os.path.join(self.media_root, "products")))
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.add_product(image_upload("a.JPG"))
+        second = self.add_product(image_upload("b.jpg"), name="Hat")
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r"^products/[0-9a-f]{64}\.jpg$")
+        self.assertEqual(StoredFile.objects.get().references, 2)
+        # The original plus a WebP and a JPEG per rendition width.
+        self.assertEqual(len(self.stored_files()), 7)
+
+    def test_files_are_removed_with_their_last_reference(self):
+        first = self.add_product(image_upload())
+        second = self.add_product(image_upload(), name="Hat")
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(len(self.stored_files()), 7)
+        self.assertEqual(StoredFile.objects.get().references, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(self.stored_files(), [])
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_replacing_image_releases_old_file(self):
+        product = self.add_product(image_upload(size=(200, 100)))
+        old_name = product.image.name
+        product = Product.objects.get()
+        product.image = image_upload(size=(300, 100))
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertNotEqual(product.image.name, old_name)
+        self.assertFalse(product.image.storage.exists(old_name))
+        self.assertEqual(len(self.stored_files()), 3)
+
+    def test_rolled_back_save_writes_no_file(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Product.objects.create(store=self.store, name="Shirt", price=5,
+                                       image=image_upload())
+                raise RuntimeError
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, "products")))
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_renditions_are_never_rewritten(self):
+        product = self.add_product(image_upload())
+        name = rendition_name(product.image.name, 160, "webp")
+        self.assertIn(f".{RENDITION_VERSION}.160w.", name)
+        before = os.stat(os.path.join(self.media_root, name))
+        self.add_product(image_upload(), name="Hat")
+        self.assertEqual(render(product.image.storage, product.image.name), [160, 320, 640])
+        after = os.stat(os.path.join(self.media_root, name))
+        self.assertEqual((after.st_ino, after.st_mtime_ns), (before.st_ino, before.st_mtime_ns))
+
+    def test_content_addressed_media_is_immutable(self):
+        product = self.add_product(image_upload())
+        request = RequestFactory().get("/media/")
+        response = serve_media(request, product.image.name, document_root=self.media_root)
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+        with open(os.path.join(self.media_root, "legacy.jpg"), "wb"):
+            pass
+        response = serve_media(request, "legacy.jpg", document_root=self.media_root)
+        self.assertNotIn("Cache-Control", response)
@@ -33,11 +33,17 @@ urlpatterns = [
     path("cart/add/<int:product_id>/", views.add_to_cart, name="add_to_cart"),
     path("cart/remove/<int:item_id>/", views.remove_from_cart, name="remove_from_cart"),
     path("checkout/", views.checkout, name="checkout"),
+    path("checkout/start/", views.start_checkout, name="start_checkout"),
     path("cart/update/", views.update_cart, name="update_cart"),
+    path("orders/", views.order_history, name="order_history"),
 
 
 
     # Password Reset
     path("request_password_reset/", views.request_password_reset, name="request_password_reset"),
     path("reset_password/<uuid:token>/", views.reset_password, name="reset_password"),
+    path(
+        "reset_password/<uidb64>/<token>/", views.reset_password_signed,
+        name="reset_password_signed",
+    ),
 ]
@@ -0,0 +1,29 @@
+import time
+
+from django.core.cache import cache
+
+# Cached card fragments, object cache rows and cart pricings are keyed by a
+# version token kept in the cache under its own key. Bumping stores a new token,
+# so entries cached under the old one are never read again and simply age out.
+# A missing token (never bumped, or evicted) is replaced by a fresh one rather
+# than a default, which an entry cached before the token was lost might still
+# be stored under.
+
+
+def bump_version(key):
+    """Store a new version token under `key`, retiring everything cached under the old one."""
+    cache.set(key, time.time_ns(), None)
+
+
+def get_versions(keys):
+    """Return {key: version token} for `keys`, with one cache round trip when none are missing."""
+    keys = list(keys)
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = time.time_ns()
+            # Another reader may have just stored a token; use theirs if so.
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[key] = version
+    return versions
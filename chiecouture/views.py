@@ -3,38 +3,61 @@ import logging
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
-from django.core.mail import send_mail
-from django.conf import settings
 from django.contrib import messages
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.contrib.auth.tokens import default_token_generator
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import DeleteView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.utils.encoding import force_bytes
+from django.utils.http import (
+    url_has_allowed_host_and_scheme, urlsafe_base64_decode, urlsafe_base64_encode,
+)
+from django.views.static import serve
 
 from rest_framework import generics, permissions
 
-from .twitter_client import tweet_new_store, tweet_new_product
 from .models import (
     Product,
     Store,
     Cart,
     CartItem,
-    Review,
     Order,
-    OrderItem,
+    Purchase,
+    Review,
     PasswordResetToken,
     User,
 )
-from .forms import UserRegisterForm, ProductForm, ReviewForm, StoreForm
-from .serializers import ReviewSerializer
+from .carts import add_to_session_cart, flush_cart, update_quantities
+from .checkout import CheckoutError, place_order
+from .conditional import conditional_get
+from .facets import apply_filters, facet_counts
+from .fragments import attach_card_versions
+from .idempotency import idempotent
+from .object_cache import get_cached_or_404, product_cache, store_cache
+from .outbox import queue_email
+from .forms import UserRegisterForm, ProductForm, ReviewForm, StoreForm, ProductFilterForm
+from .pagination import REVIEW_ORDERING, ReviewCursorPagination, keyset_paginate
+from .pricing import bump_cart_version, price_cart
+from .reservations import InsufficientStock, held_until, hold_stock
+from .search import RANK_ORDERING, search_products
+from .storage import is_content_addressed
+from .serializers import ReviewSerializer, expand_queryset
 
 logger = logging.getLogger(__name__)
 
+# Latest reviews shown on the dashboard; vendor_reviews pages through the rest.
+DASHBOARD_REVIEWS = 5
+
 # -------------------------
 # General Views
 # -------------------------
 def home(request):
-    stores = Store.objects.all()
+    stores = attach_card_versions(Store.objects.all(), "store")
     return render(request, "home.html", {"stores": stores})
 
 def register(request):
@@ -44,19 +67,21 @@ def register(request):
             user = form.save()
             login(request, user)
             if user.role == "buyer":
-                Cart.objects.create(user=user)
+                # Logging in may already have made the cart for a session's items.
+                Cart.objects.get_or_create(user=user)
             return redirect("home")
     else:
         form = UserRegisterForm()
     return render(request, "register.html", {"form": form})
 
 def store_list(request):
-    stores = Store.objects.all()
+    stores = attach_card_versions(Store.objects.all(), "store")
     return render(request, "store_list.html", {"stores": stores})
 
 def store_detail(request, store_id):
-    store = get_object_or_404(Store, id=store_id)
-    products = store.products.all()
+    store = get_cached_or_404(store_cache, store_id)
+    products = keyset_paginate(request, store.products.all())
+    attach_card_versions(products, "product")
     return render(request, "store_detail.html", {"store": store, "products": products})
 
 # -------------------------
@@ -74,11 +99,6 @@ def create_store(request):
             store = form.save(commit=False)
             store.owner = request.user
             store.save()
-            try:
-                logo_path = store.logo.path if store.logo else None
-                tweet_new_store(store_name=store.name, description=store.description, logo_path=logo_path)
-            except Exception:
-                pass
             return redirect("store_dashboard")
     else:
         form = StoreForm()
@@ -118,7 +138,7 @@ def store_dashboard(request):
         return redirect("create_store")
     store = request.user.store
     products = store.products.all()
-    reviews = Review.objects.filter(product__store=store).order_by("-created_at")
+    reviews = store.reviews.select_related("user").order_by(*REVIEW_ORDERING)[:DASHBOARD_REVIEWS]
     return render(request, "store_dashboard.html", {"store": store, "products": products, "reviews": reviews})
 
 @login_required
@@ -131,14 +151,6 @@ def add_product(request):
             product = form.save(commit=False)
             product.store = request.user.store
             product.save()
-            try:
-                tweet_new_product(
-                    store_name=product.store.name,
-                    product_name=product.name,
-                    description=product.description
-                )
-            except Exception:
-                pass
             return redirect("store_dashboard")
     else:
         form = ProductForm()
@@ -152,13 +164,17 @@ def delete_product(request, product_id):
 
 @login_required
 def edit_product(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
     if request.method == 'POST':
+        # The form saves every column, so start from the current row, not a cached copy.
+        product = get_object_or_404(Product, id=product_id)
         form = ProductForm(request.POST, request.FILES, instance=product)
         if form.is_valid():
-            form.save()
+            # Only write the form's columns; counters like reserved_stock and the
+            # rating aggregates are updated concurrently with F() expressions.
+            form.save(commit=False).save(update_fields=[*ProductForm.Meta.fields, "updated_at"])
             return redirect('store_dashboard')
     else:
+        product = get_cached_or_404(product_cache, product_id)
         form = ProductForm(instance=product)
     return render(request, 'edit_product.html', {'form': form, 'product': product})
 
@@ -166,20 +182,36 @@ def edit_product(request, product_id):
 # Product & Review Views
 # -------------------------
 def product_list(request):
-    products = Product.objects.all()
-    return render(request, "product_list.html", {"products": products})
+    query = request.GET.get("q", "").strip()
+    filter_form = ProductFilterForm(request.GET)
+    filters = filter_form.cleaned_data if filter_form.is_valid() else {}
+    matches = search_products(query) if query else Product.objects.all()
+    ordering = RANK_ORDERING if query else ("id",)
+    products = keyset_paginate(request, apply_filters(matches, filters), ordering=ordering)
+    attach_card_versions(products, "product")
+    # Facet counts only change with the filters, so later pages skip them.
+    facets = None if request.GET.get("cursor") else facet_counts(matches, filters)
+    return render(request, "product_list.html", {
+        "products": products,
+        "query": query,
+        "filter_form": filter_form,
+        "facets": facets,
+    })
 
 def product_detail(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
-    reviews = product.reviews.all().order_by("-created_at")
+    product = get_cached_or_404(product_cache, product_id)
+    reviews = keyset_paginate(
+        request, product.reviews.select_related("user"), ordering=REVIEW_ORDERING
+    )
     if request.method == "POST" and request.user.is_authenticated:
         form = ReviewForm(request.POST)
         if form.is_valid():
             review = form.save(commit=False)
             review.user = request.user
             review.product = product
-            review.verified = product.orderitem_set.filter(order__user=request.user).exists()
-            review.save()
+            review.verified = Purchase.has_bought(request.user, product)
+            with transaction.atomic():
+                review.save()
             return redirect("product_detail", product_id=product.id)
     else:
         form = ReviewForm()
@@ -188,10 +220,20 @@ def product_detail(request, product_id):
 class ProductReviewsListView(generics.ListAPIView):
     serializer_class = ReviewSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = ReviewCursorPagination
 
     def get_queryset(self):
         product_id = self.kwargs["pk"]
-        return Review.objects.filter(product_id=product_id)
+        return expand_queryset(
+            Review.objects.filter(product_id=product_id), ReviewSerializer, self.request
+        )
+
+    def list(self, request, *args, **kwargs):
+        build = super().list
+        return conditional_get(
+            request, Review.objects.filter(product_id=self.kwargs["pk"]),
+            lambda: build(request, *args, **kwargs),
+        )
     
 @login_required
 def vendor_reviews(request):
@@ -205,8 +247,10 @@ def vendor_reviews(request):
         messages.warning(request, "You don't have a store yet.")
         return redirect("create_store")
 
-    # Get all reviews for products in this store
-    reviews = Review.objects.filter(product__store=store).order_by("-created_at")
+    # One page of the store's reviews, newest first
+    reviews = keyset_paginate(
+        request, store.reviews.select_related("user", "product"), ordering=REVIEW_ORDERING
+    )
 
     return render(request, "vendor_reviews.html", {"store": store, "reviews": reviews})
 
@@ -214,125 +258,194 @@ def vendor_reviews(request):
 # -------------------------
 # Cart & Checkout Views
 # -------------------------
-@login_required
 def add_to_cart(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
-    cart, _ = Cart.objects.get_or_create(user=request.user)
-    quantity = int(request.POST.get("quantity", 1))
-    cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-    if not created:
-        cart_item.quantity += quantity
-    else:
-        cart_item.quantity = quantity
-    cart_item.save()
+    product = get_cached_or_404(product_cache, product_id)
+    try:
+        quantity = max(int(request.POST.get("quantity", 1)), 1)
+    except ValueError:
+        quantity = 1
+    # Kept in the session and persisted later (see carts.py), so browsing and
+    # adding items costs no cart writes; anonymous carts are merged on login.
+    add_to_session_cart(request, product.id, quantity)
+    messages.success(request, f"{product.name} added to your cart.")
+    next_url = request.POST.get("next") or request.META.get("HTTP_REFERER")
+    if next_url and url_has_allowed_host_and_scheme(
+        next_url, allowed_hosts={request.get_host()}, require_https=request.is_secure()
+    ):
+        return redirect(next_url)
     return redirect("cart")
 
 @login_required
 def update_cart(request):
+    flush_cart(request)
     if request.method == "POST":
+        quantities = {}
         for key, value in request.POST.items():
             if key.startswith("quantity_"):
                 try:
-                    item_id = int(key.split("_")[1])
-                    quantity = int(value)
-                    item = CartItem.objects.get(id=item_id, cart__user=request.user)
-                    if quantity > 0:
-                        item.quantity = quantity
-                        item.save()
-                    else:
-                        item.delete()
-                except (ValueError, CartItem.DoesNotExist):
+                    quantities[int(key.split("_")[1])] = int(value)
+                except ValueError:
                     continue
+        pricing = update_quantities(request.user, quantities)
+        messages.info(request, f"Cart updated. Total: £{pricing.subtotal:.2f}")
         return redirect("cart")
     return redirect("cart")
 
 @login_required
 def cart_view(request):
+    flush_cart(request)
     cart, _ = Cart.objects.get_or_create(user=request.user)
-    items = cart.items.select_related("product")
-    total = sum(item.product.price * item.quantity for item in items)
-    return render(request, "cart.html", {"items": items, "total": total})
+    return render(request, "cart.html", {"pricing": price_cart(cart.pk)})
 
 @login_required
 def remove_from_cart(request, item_id):
+    flush_cart(request)
     cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
     cart_item.delete()
+    bump_cart_version(cart_item.cart_id)
     messages.info(request, "Item removed from cart.")
     return redirect("cart")
 
 @login_required
+def start_checkout(request):
+    """Hold the cart's items until the order is placed or the hold expires."""
+    if request.method != "POST":
+        return redirect("checkout")
+    flush_cart(request)
+    cart = get_object_or_404(Cart, user=request.user)
+    pricing = price_cart(cart.pk)
+    if not pricing:
+        messages.warning(request, "Your cart is empty.")
+        return redirect("cart")
+    try:
+        hold_stock(request.user, pricing.quantities)
+    except InsufficientStock as e:
+        messages.error(request, str(e))
+        return redirect("cart")
+    return redirect("checkout")
+
+@login_required
+@idempotent
 def checkout(request):
+    flush_cart(request)
     cart = get_object_or_404(Cart, user=request.user)
-    items = cart.items.select_related("product")
-    if not items.exists():
+    pricing = price_cart(cart.pk)
+    if not pricing:
         messages.warning(request, "Your cart is empty.")
         return redirect("cart")
     if request.method == "POST":
-        order = Order.objects.create(user=request.user, total=0)
-        total = 0
-        for item in items:
-            OrderItem.objects.create(order=order, product=item.product, quantity=item.quantity, price=item.product.price)
-            total += item.product.price * item.quantity
-        order.total = total
-        order.save()
-        invoice_lines = [f"Invoice for Order #{order.id}\n\n"]
-        for order_item in order.items.all():
-            line = f"- {order_item.product.name} (x{order_item.quantity}) = ${order_item.price * order_item.quantity:.2f}"
-            invoice_lines.append(line)
-        invoice_lines.append(f"\nTotal: ${order.total:.2f}")
-        invoice_text = "\n".join(invoice_lines)
-        send_mail(
-            subject=f"Your Invoice - Order #{order.id}",
-            message=invoice_text,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[request.user.email],
-            fail_silently=False,
-        )
-        items.delete()
-        messages.success(request, "Checkout complete. Invoice sent to your email.")
+        try:
+            place_order(request.user, cart)
+        except (CheckoutError, InsufficientStock) as e:
+            messages.error(request, str(e))
+            return redirect("cart")
+        messages.success(request, "Checkout complete. Your invoice will be emailed shortly.")
         return redirect("product_list")
-    return render(request, "checkout.html", {"items": items})
+    # Viewing the page changes nothing; holds are only made by start_checkout.
+    return render(
+        request, "checkout.html", {"pricing": pricing, "held_until": held_until(request.user)}
+    )
+
+@login_required
+def order_history(request):
+    orders = keyset_paginate(
+        request,
+        Order.objects.filter(user=request.user).prefetch_related("items"),
+        ordering=("-id",),
+    )
+    return render(request, "orders.html", {"orders": orders})
 
 # -------------------------
 # Password Reset Views
 # -------------------------
+def _reset_link(request, user):
+    """
+    Absolute URL of a password reset link for `user`. Signed links (the
+    default) carry an HMAC-signed, timestamped token that stops working once
+    the password changes or PASSWORD_RESET_TIMEOUT passes, and write nothing;
+    PASSWORD_RESET_TOKEN_MODE = "table" stores a PasswordResetToken instead.
+    """
+    if getattr(settings, "PASSWORD_RESET_TOKEN_MODE", "signed") == "table":
+        token = PasswordResetToken.objects.create(user=user)
+        return request.build_absolute_uri(reverse("reset_password", args=[token.token]))
+    uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
+    token = default_token_generator.make_token(user)
+    return request.build_absolute_uri(reverse("reset_password_signed", args=[uidb64, token]))
+
 def request_password_reset(request):
     if request.method == "POST":
         email = request.POST.get("email")
         try:
             user = User.objects.get(email=email)
-            token = PasswordResetToken.objects.create(user=user)
-            reset_link = request.build_absolute_uri(f"/reset_password/{token.token}/")
-            send_mail(
-                "Password Reset Request",
-                f"Click the link to reset your password: {reset_link}",
-                settings.DEFAULT_FROM_EMAIL,
-                [email],
-            )
-            messages.success(request, "Password reset email sent.")
+            with transaction.atomic():
+                queue_email(
+                    "Password Reset Request",
+                    f"Click the link to reset your password: {_reset_link(request, user)}",
+                    [email],
+                )
+            messages.success(request, "We'll email you a reset link shortly.")
             return redirect("home")
         except User.DoesNotExist:
             messages.error(request, "Email not found.")
     return render(request, "request_password_reset.html")
 
+def _set_new_password(request, user, on_reset=None):
+    """Show the new password form for `user` and apply it; `on_reset` retires the link."""
+    if request.method == "POST":
+        new_password = request.POST.get("password")
+        confirm_password = request.POST.get("confirm_password")
+        if new_password != confirm_password:
+            messages.error(request, "Passwords do not match.")
+            return redirect(request.path)
+        try:
+            validate_password(new_password, user)
+        except ValidationError as e:
+            for error in e.messages:
+                messages.error(request, error)
+            return redirect(request.path)
+        with transaction.atomic():
+            user.password = make_password(new_password)
+            user.save()
+            if on_reset:
+                on_reset()
+        messages.success(request, "Password has been reset.")
+        return redirect("login")
+    return render(request, "reset_password.html")
+
 def reset_password(request, token):
     try:
-        token_obj = PasswordResetToken.objects.get(token=token)
+        token_obj = PasswordResetToken.objects.select_related("user").get(token=token)
     except PasswordResetToken.DoesNotExist:
         messages.error(request, "Invalid reset link.")
         return redirect("home")
     if not token_obj.is_valid():
         messages.error(request, "Reset link expired.")
         return redirect("home")
-    if request.method == "POST":
-        new_password = request.POST.get("password")
-        confirm_password = request.POST.get("confirm_password")
-        if new_password != confirm_password:
-            messages.error(request, "Passwords do not match.")
-            return redirect("reset_password", token=token)
-        token_obj.user.password = make_password(new_password)
-        token_obj.user.save()
-        token_obj.delete()
-        messages.success(request, "Password has been reset.")
-        return redirect("login")
-    return render(request, "reset_password.html", {"token": token})
+    return _set_new_password(request, token_obj.user, on_reset=token_obj.delete)
+
+def reset_password_signed(request, uidb64, token):
+    try:
+        user = User.objects.get(pk=urlsafe_base64_decode(uidb64).decode())
+    except (TypeError, ValueError, OverflowError, User.DoesNotExist, ValidationError):
+        # The same failures PasswordResetConfirmView treats as an invalid link.
+        user = None
+    if user is None or not default_token_generator.check_token(user, token):
+        messages.error(request, "Invalid or expired reset link.")
+        return redirect("home")
+    # Changing the password invalidates the signed token.
+    return _set_new_password(request, user)
+
+# -------------------------
+# Media
+# -------------------------
+def serve_media(request, path, document_root=None):
+    """
+    Development media server (see project urls). Content-addressed files never
+    change under their name, so they are sent with MEDIA_CACHE_CONTROL.
+    """
+    response = serve(request, path, document_root=document_root)
+    if response.status_code == 200 and is_content_addressed(path):
+        response["Cache-Control"] = getattr(
+            settings, "MEDIA_CACHE_CONTROL", "public, max-age=31536000, immutable"
+        )
+    return response
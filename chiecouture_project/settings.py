@@ -56,12 +56,14 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'chiecouture.User'
 
 MIDDLEWARE = [
+    "chiecouture.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    "chiecouture.middleware.IdempotencyMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
@@ -100,6 +102,35 @@ DATABASES = {
 }
 
 
+# Cache
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared cache
+# (e.g. django.core.cache.backends.redis.RedisCache) in production.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+# Cart additions live in the session and are written to the database at most
+# every CART_PERSIST_INTERVAL seconds (and whenever the cart is viewed or checked out)
+CART_PERSIST_INTERVAL = int(os.getenv("CART_PERSIST_INTERVAL", "300"))
+
+# Seconds that starting checkout reserves the cart's items for (see reservations.py);
+# run manage.py expire_reservations periodically to release abandoned holds
+RESERVATION_TTL = int(os.getenv("RESERVATION_TTL", "600"))
+
+# Responses to POSTs with an Idempotency-Key header are replayed for this long;
+# a retry arriving while the first request runs gets 409 for at most
+# IDEMPOTENCY_LOCK_TIMEOUT seconds (the lock expires if a worker dies mid-request)
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", str(24 * 60 * 60)))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "60"))
+
+# Seconds a Store/Product row stays in the read-through object cache
+OBJECT_CACHE_TIMEOUT = int(os.getenv("OBJECT_CACHE_TIMEOUT", "300"))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -139,6 +170,14 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Uploads are named by content hash, deduplicated and reference-counted
+# (chiecouture/storage.py). Files under those names never change, so the web
+# server can send them with MEDIA_CACHE_CONTROL, as serve_media does in DEBUG.
+STORAGES = {
+    "default": {"BACKEND": "chiecouture.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -146,11 +185,40 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 
+# Password reset links are "signed" (an HMAC-signed, timestamped token valid for
+# PASSWORD_RESET_TIMEOUT seconds, no database write) or "table" (a
+# PasswordResetToken row per request, valid as long; purge_reset_tokens deletes
+# expired ones).
+PASSWORD_RESET_TOKEN_MODE = os.getenv("PASSWORD_RESET_TOKEN_MODE", "signed")
+PASSWORD_RESET_TIMEOUT = 3600
+
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 DEFAULT_FROM_EMAIL = "noreply@chiecouture.com"
 
+# Outbox worker (manage.py send_outbox): retries back off from OUTBOX_RETRY_DELAY
+# seconds, doubling per attempt, and give up after OUTBOX_MAX_ATTEMPTS. A claimed
+# batch is hidden from other workers for OUTBOX_CLAIM_TIMEOUT seconds.
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETRY_DELAY = int(os.getenv("OUTBOX_RETRY_DELAY", "60"))
+OUTBOX_CLAIM_TIMEOUT = int(os.getenv("OUTBOX_CLAIM_TIMEOUT", "600"))
+
+# Store and product announcements (manage.py dispatch_announcements) are posted
+# by ANNOUNCEMENT_TRANSPORT, by default to X. Local setups without X credentials
+# can set it to chiecouture.announcements.MemoryTransport, which only keeps them
+# in memory. Retries back off and give up like the outbox, and a rate-limited
+# batch waits for the limit to reset.
+ANNOUNCEMENT_TRANSPORT = os.getenv(
+    "ANNOUNCEMENT_TRANSPORT", "chiecouture.twitter_client.XTransport"
+)
+ANNOUNCEMENT_MAX_ATTEMPTS = int(os.getenv("ANNOUNCEMENT_MAX_ATTEMPTS", "5"))
+ANNOUNCEMENT_RETRY_DELAY = int(os.getenv("ANNOUNCEMENT_RETRY_DELAY", "60"))
+ANNOUNCEMENT_CLAIM_TIMEOUT = int(os.getenv("ANNOUNCEMENT_CLAIM_TIMEOUT", "600"))
+
 LOGIN_REDIRECT_URL = 'home'
-PASSWORD_RESET_TIMEOUT = 3600
+
+# Per-request SQL/template/view timings (Server-Timing header + sampled JSON log lines)
+REQUEST_METRICS_ENABLED = os.getenv("REQUEST_METRICS_ENABLED", "False").lower() == "true"
+REQUEST_METRICS_LOG_SAMPLE_RATE = float(os.getenv("REQUEST_METRICS_LOG_SAMPLE_RATE", "0.01"))
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (